@@ -1,24 +1,36 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from oauth2client.service_account import ServiceAccountCredentials
-from fpdf import FPDF
-import io
 import os
+import codecs
 import openpyxl
 import json
+import re
+import time
+import threading
+import pyarrow as pa
+import pyarrow.feather as feather
 from datetime import datetime, date
+from relatorio_pdf import get_val, gerar_pdfs_lote, montar_zip, chave_relatorio, pdf_relatorio
+from medicao import ARQUIVO_METRICAS, Medicao, estado_metricas
+from drive import ID_PASTA_RAIZ, MESES, PlanilhaDrive, conectar, data_da_pasta, pastas_destino, limpar_nome, enviar_pdf, enviar_pdfs
+from planilha import (COLS_DATA, COLUNAS_NUMERICAS, SEM_BASE, IndiceAmostras, ler_aba_xlsx, mesmo_valor,
+                      alteracoes_celulas, gravar_com_mescla, descrever_conflito)
 
 # --- CONFIGURAÇÃO ---
 st.set_page_config(page_title="Sistema Controle UFV", layout="wide", page_icon="🌲")
 
-# ✅ IDs CONFIGURADOS
-ID_ARQUIVO_EXCEL = "1L0qTK6oy2axnCSlLadoyk9q5fExSnA6v"
-ID_PASTA_RAIZ = "1nZtJjVZUVx65GtjnmpTn5Hw_eZOXwpIY"
 ARQUIVO_CONFIG = "config_colunas_v54.json"
 
+# ✅ TABELA PAGINADA
+TAMANHOS_PAGINA = [50, 100, 250, 500, 1000]
+TAMANHO_PAGINA_PADRAO = 100
+
+# ✅ SNAPSHOT LOCAL (partida rápida)
+PASTA_SNAPSHOTS = os.environ.get("PASTA_SNAPSHOTS", ".snapshots")
+VERSAO_SNAPSHOT = 2  # muda quando o formato da aba tratada muda (2: tipos normalizados); snapshots de outra versão são ignorados
+SALVAMENTO_JANELA_S = float(os.environ.get("SALVAMENTO_JANELA_S", 2))  # espera por outros cliques antes de gravar (junta num envio)
+
 # --- COLUNAS PADRÃO ---
 COLS_PADRAO_MADEIRA = [
     "Selecionar", "Código UFV", "Data de entrada", "Nome do Cliente", "Aplicação", 
@@ -38,20 +50,6 @@ COLS_PADRAO_SOLUCAO = [
     "Grau do aspecto", "Descrição do aspecto"
 ]
 
-# --- REGRAS ---
-REGRAS_RETENCAO = {
-    "Postes": 4.0, "Mourões": 6.5, "Dormentes": 6.5, "Cruzetas": 9.6, "Estacas": 6.5, "Madeira Serrada": 4.0
-}
-DESC_GRAU = {
-    1: ("Profunda e regular", "Indica a penetração profunda e uniforme em toda a extensão do alburno."),
-    2: ("Profunda e irregular", "Indica a penetração profunda, mas desuniforme em toda a extensão do alburno."),
-    3: ("Parcial e regular", "Indica a penetração uniforme, mas não total pela extensão do alburno."),
-    4: ("Parcial e irregular", "Indica a penetração desuniforme e não total pela extensão do alburno."),
-    5: ("Sem Reação do Cromoazurol", "Sem Reação do Cromoazurol")
-}
-TXT_APROVADO = "Os resultados da análise química apresentaram uma retenção do produto de acordo com o padrão mínimo exigido pela norma ABNT NBR 16143"
-TXT_REPROVADO = "Os resultados da análise química apresentaram uma retenção do produto inferior ao padrão mínimo exigido pela norma ABNT NBR 16143"
-
 # --- PERSISTÊNCIA (CORRIGIDO AQUI) ---
 def carregar_config():
     if os.path.exists(ARQUIVO_CONFIG):
@@ -66,313 +64,476 @@ def salvar_config(config):
             json.dump(config, f)
     except: pass
 
+# --- MEDIÇÃO DE DESEMPENHO (TEMPO POR ETAPA) ---
+def painel_desempenho():
+    """Últimas operações medidas neste processo, com o tempo de cada etapa."""
+    recentes = list(estado_metricas()['recentes'])[::-1]
+    with st.sidebar.expander("⏱️ Desempenho"):
+        if not recentes: st.caption("Nenhuma operação medida ainda."); return
+        st.dataframe(pd.DataFrame([{'hora': r['quando'][11:], 'operação': r['operacao'], 'ms': r['total_ms']} for r in recentes]), hide_index=True, use_container_width=True)
+        i = st.selectbox("Detalhar", range(len(recentes)), format_func=lambda i: f"{recentes[i]['quando'][11:]} {recentes[i]['operacao']}")
+        r = recentes[i]
+        if r['etapas']: st.dataframe(pd.DataFrame({'etapa': list(r['etapas']), 'ms': list(r['etapas'].values())}), hide_index=True, use_container_width=True)
+        if r['dados']: st.json(r['dados'])
+        if r['erro']: st.error(r['erro'])
+        if ARQUIVO_METRICAS: st.caption(f"Histórico completo em `{ARQUIVO_METRICAS}` (JSON lines).")
+
 # --- DRIVE ---
+@st.cache_resource(show_spinner=False)
 def get_drive_service():
-    scope = ["https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets["gcp_service_account"]), scope)
-    return build('drive', 'v3', credentials=creds)
+    """Um único cliente do Drive por processo, compartilhado entre sessões."""
+    return conectar(dict(st.secrets["gcp_service_account"]))
 
-def get_or_create_folder(service, folder_name, parent_id):
-    try:
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and '{parent_id}' in parents and trashed=false"
-        results = service.files().list(q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-        items = results.get('files', [])
-        if items: return items[0]['id']
-        else:
-            metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]}
-            return service.files().create(body=metadata, fields='id', supportsAllDrives=True).execute().get('id')
-    except: return None
-
-def salvar_pdf_organizado(pdf_bytes, nome_arquivo, data_entrada_raw):
+def salvar_pdf_organizado(pdf_bytes, nome_arquivo, data_entrada_raw, chave=None):
     try:
         if not ID_PASTA_RAIZ: st.error("⚠️ ID da pasta não configurado."); return
         service = get_drive_service()
-        meses = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
-        
-        data_obj = datetime.now()
-        if isinstance(data_entrada_raw, (datetime, date)): 
-            data_obj = data_entrada_raw
-        elif data_entrada_raw and str(data_entrada_raw).strip() not in ["", "NaT", "None", "nan"]:
-            try:
-                v_str = str(data_entrada_raw).strip().split(" ")[0]
-                for fmt in ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d"]:
-                    try: data_obj = datetime.strptime(v_str, fmt); break
-                    except: continue
-            except: pass
-            
-        ano_str = str(data_obj.year); mes_str = meses[data_obj.month]
-        ano_id = get_or_create_folder(service, ano_str, ID_PASTA_RAIZ)
-        if not ano_id: st.error("Erro pasta ano"); return
-        mes_id = get_or_create_folder(service, mes_str, ano_id)
-        if not mes_id: st.error("Erro pasta mês"); return
-        
-        nome_limpo = nome_arquivo.replace("/", "-").replace("\\", "-")
-        media = MediaIoBaseUpload(io.BytesIO(pdf_bytes), mimetype='application/pdf', resumable=False)
-        metadata = {'name': nome_limpo, 'parents': [mes_id]}
-        service.files().create(body=metadata, media_body=media, fields='id', supportsAllDrives=True).execute()
-        st.balloons(); st.toast(f"Salvo: {ano_str}/{mes_str}", icon="✅"); st.success(f"Arquivo **{nome_limpo}** salvo em: **{ano_str} > {mes_str}**")
+        data_obj = data_da_pasta(data_entrada_raw)
+        ano_str = str(data_obj.year); mes_str = MESES[data_obj.month]
+        nome_limpo = limpar_nome(nome_arquivo)
+        with Medicao("salvar_pdf", arquivos=1, bytes=len(pdf_bytes)) as m:
+            with m.etapa("pastas"): pastas_destino(service, [data_obj])
+            with m.etapa("upload"): _, situacao = enviar_pdf(service, pdf_bytes, nome_arquivo, data_obj, chave)
+            m.dados['situacao'] = situacao
+        if situacao == "igual": st.info(f"**{nome_limpo}** já está em **{ano_str} > {mes_str}** com este mesmo conteúdo. Nada foi enviado."); return
+        st.balloons(); st.toast(f"Salvo: {ano_str}/{mes_str}", icon="✅")
+        if situacao == "atualizado": st.success(f"Arquivo **{nome_limpo}** atualizado em: **{ano_str} > {mes_str}** (substituiu a versão anterior)")
+        else: st.success(f"Arquivo **{nome_limpo}** salvo em: **{ano_str} > {mes_str}**")
     except Exception as e: st.error(f"Erro ao salvar PDF: {e}")
 
-# --- MATEMÁTICA FORTE ---
-def to_float(v):
-    """Converte qualquer coisa para float na marra."""
-    try:
-        if pd.isna(v): return 0.0
-        s_val = str(v).strip().replace(",", ".")
-        if s_val == "": return 0.0
-        return float(s_val)
-    except: return 0.0
-
-def aplicar_formulas_excel(df):
-    erros = []
-    for i, row in df.iterrows():
-        try:
-            codigo = row.get('Código UFV', f'Linha {i}')
-            
-            # --- 1. CÁLCULO DE GRAU (PRIORIDADE TOTAL) ---
-            if 'Grau' in df.columns:
-                raw_grau = row.get('Grau')
-                grau = to_float(raw_grau)
-                
-                if grau > 0 and int(grau) in DESC_GRAU:
-                    d_curta, d_longa = DESC_GRAU[int(grau)]
-                    df.at[i, 'Descrição Grau'] = d_curta
-                    df.at[i, 'Descrição Penetração'] = d_longa
-            
-            # --- 2. CÁLCULO FÍSICO ---
-            dens_kg_m3 = 0.0
-            
-            if 'Diâmetro 1 (mm)' in df.columns:
-                d_list = [to_float(row.get(f'Diâmetro {x} (mm)')) for x in range(1,6)]
-                diams = [d for d in d_list if d > 0]
-                diam_medio_cm = (sum(diams)/len(diams))/10.0 if len(diams) > 0 else 0
-                
-                if diam_medio_cm > 0: df.at[i, 'Diâmetro médio (cm)'] = round(diam_medio_cm, 2)
-
-                c_list = [to_float(row.get(f'Comprim. {x} (mm)')) for x in range(1,6)]
-                comps = [c for c in c_list if c > 0]
-                comp_medio_cm = (sum(comps)/len(comps))/10.0 if len(comps) > 0 else 0
-                if comp_medio_cm > 0: df.at[i, 'Comprim. Médio (cm)'] = round(comp_medio_cm, 2)
-
-                m_list = [to_float(row.get(f'Massa {x} (g)')) for x in range(1,6)]
-                massas = [m for m in m_list if m > 0]
-                massa_media = sum(massas)/len(massas) if len(massas) > 0 else 0
-                if massa_media > 0: df.at[i, 'Massa média (g)'] = round(massa_media, 2)
-
-                if diam_medio_cm > 0 and comp_medio_cm > 0:
-                    vol = 3.14159 * ((diam_medio_cm/2)**2) * comp_medio_cm
-                    df.at[i, 'Volume (cm³)'] = round(vol, 2)
-                    
-                    if vol > 0 and massa_media > 0:
-                        dens_g_cm3 = massa_media / vol
-                        dens_kg_m3 = dens_g_cm3 * 1000
-                        df.at[i, 'Densidade (g/cm³)'] = round(dens_g_cm3, 3)
-                        df.at[i, 'Densidade (Kg/m³)'] = round(dens_kg_m3, 2)
-
-            # --- 3. QUÍMICA ---
-            if 'Cromo (%)' in df.columns:
-                cr_pct = to_float(row.get('Cromo (%)'))
-                cu_pct = to_float(row.get('Cobre (%)'))
-                as_pct = to_float(row.get('Arsênio (%)'))
-                soma_conc = cr_pct + cu_pct + as_pct
-                df.at[i, 'Soma Concentração'] = round(soma_conc, 2)
-
-                if soma_conc > 0:
-                    df.at[i, 'Balanço Cromo %'] = round((cr_pct/soma_conc)*100, 2)
-                    df.at[i, 'Balanço Cobre %'] = round((cu_pct/soma_conc)*100, 2)
-                    df.at[i, 'Balanço Arsênio %'] = round((as_pct/soma_conc)*100, 2)
-                    df.at[i, 'Balanço Total'] = 100.00
-                
-                if dens_kg_m3 == 0 and 'Densidade (Kg/m³)' in df.columns:
-                    dens_kg_m3 = to_float(row.get('Densidade (Kg/m³)', 0))
-
-                if dens_kg_m3 > 0:
-                    ret_cr = (cr_pct/100)*dens_kg_m3
-                    ret_cu = (cu_pct/100)*dens_kg_m3
-                    ret_as = (as_pct/100)*dens_kg_m3
-                    
-                    df.at[i, 'Retenção Cromo (Kg/m³)'] = round(ret_cr, 2)
-                    df.at[i, 'Retenção Cobre (Kg/m³)'] = round(ret_cu, 2)
-                    df.at[i, 'Retenção Arsênio (Kg/m³)'] = round(ret_as, 2)
-                    
-                    ret_total = ret_cr + ret_cu + ret_as
-                    df.at[i, 'Retenção Total (Kg/m³)'] = round(ret_total, 2)
-
-                    # 4. APROVAÇÃO
-                    aplicacao = str(row.get('Aplicação', '')).strip()
-                    ret_esp = 0.0
-                    for k, v in REGRAS_RETENCAO.items():
-                        if k.lower() in aplicacao.lower(): ret_esp = v; break
-                    
-                    if ret_esp > 0:
-                        df.at[i, 'Retenção'] = ret_esp
-                        df.at[i, 'Retenção Esp.'] = ret_esp
-                        df.at[i, 'Observação'] = TXT_APROVADO if ret_total >= ret_esp else TXT_REPROVADO
-
-        except Exception as e: 
-            erros.append(f"Erro em {codigo}: {str(e)}")
-            
+def salvar_pdfs_lote(arquivos, ao_progredir=None):
+    """enviar_pdfs (drive.py) com o cliente do app."""
+    return enviar_pdfs(get_drive_service(), arquivos, ao_progredir)
+
+# --- ERROS DE CÁLCULO (AS FÓRMULAS FICAM NO calculos.py) ---
+def mostrar_erros_calculo(erros):
     if erros:
         with st.expander("⚠️ Detalhes dos Erros de Cálculo"):
-            for erro in erros: st.write(erro)
+            for erro_msg in erros: st.write(erro_msg)
+
+# --- CACHE DA PLANILHA (POR REVISÃO DO DRIVE) ---
+TTL_REVISAO = 10  # segundos entre consultas de metadados ao Drive
 
+@st.cache_data(ttl=TTL_REVISAO, show_spinner=False)
+def revisao_excel_drive():
+    """Identificador da versão atual do arquivo no Drive (consulta só metadados, não baixa nada)."""
+    return PlanilhaDrive(get_drive_service()).revisao()
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def baixar_workbook(revisao):
+    """Bytes do xlsx de uma revisão. Todas as abas saem do mesmo download."""
+    return PlanilhaDrive(get_drive_service()).baixar(revisao)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def ler_aba(aba_nome, revisao):
+    df = ler_aba_xlsx(baixar_workbook(revisao), aba_nome)
+    df.attrs['revisao'] = revisao
+    return df
+
+# --- SNAPSHOT LOCAL (FEATHER, MARCADO COM A REVISÃO) ---
+def caminho_snapshot(aba_nome, ext):
+    return os.path.join(PASTA_SNAPSHOTS, re.sub(r'\W+', '_', aba_nome.lower()) + "." + ext)
+
+def snapshot_info(aba_nome):
+    """{'revisao', 'formato', 'gravado_em', 'versao'} do snapshot local da aba, ou None se não houver (ou for de outra versão)."""
+    try:
+        with open(caminho_snapshot(aba_nome, "json"), "r") as f: info = json.load(f)
+    except: return None
+    return info if info.get('versao') == VERSAO_SNAPSHOT else None
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def ler_snapshot(aba_nome, revisao, formato):
+    """Um DataFrame por revisão, compartilhado pelas sessões (cache_data faria uma cópia inteira a cada acesso).
+    Não alterar no lugar: o carregar_excel_drive entrega uma cópia rasa."""
+    caminho = caminho_snapshot(aba_nome, formato)
+    if formato == "feather": df = feather.read_table(caminho, memory_map=True).to_pandas()
+    else: df = pd.read_pickle(caminho)
+    df.attrs['revisao'] = revisao
     return df
 
-@st.cache_data(ttl=60)
+def gravar_snapshot(aba_nome, revisao, df):
+    """Grava a aba já tratada em Feather sem compressão (lido com memory map).
+    Colunas com tipos misturados não cabem no Arrow; nesse caso a aba vai em pickle."""
+    os.makedirs(PASTA_SNAPSHOTS, exist_ok=True)
+    formato = "feather"; tmp = caminho_snapshot(aba_nome, "tmp")
+    try: feather.write_feather(df, tmp, compression="uncompressed")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, ValueError):
+        formato = "pkl"; df.to_pickle(tmp)
+    os.replace(tmp, caminho_snapshot(aba_nome, formato))
+    with open(caminho_snapshot(aba_nome, "json.tmp"), "w") as f:
+        json.dump({'revisao': revisao, 'formato': formato, 'gravado_em': datetime.now().isoformat(timespec='seconds'), 'versao': VERSAO_SNAPSHOT}, f)
+    os.replace(caminho_snapshot(aba_nome, "json.tmp"), caminho_snapshot(aba_nome, "json"))
+
+def descartar_snapshot(aba_nome):
+    estado = estado_snapshots()
+    with estado['lock']:
+        estado['geracao'][aba_nome] = estado['geracao'].get(aba_nome, 0) + 1  # invalida a atualização em segundo plano que já começou
+        try: os.remove(caminho_snapshot(aba_nome, "json"))
+        except OSError: pass
+
+@st.cache_resource(show_spinner=False)
+def estado_snapshots():
+    return {'lock': threading.Lock(), 'em_andamento': set(), 'verificado': {}, 'geracao': {}}
+
+def atualizar_snapshot_em_segundo_plano(aba_nome, revisao_local):
+    """Confere a revisão no Drive numa thread e, se mudou, baixa e regrava o snapshot. No máximo uma por aba a cada TTL_REVISAO."""
+    estado = estado_snapshots()
+    with estado['lock']:
+        if aba_nome in estado['em_andamento'] or time.time() - estado['verificado'].get(aba_nome, 0) < TTL_REVISAO: return
+        estado['em_andamento'].add(aba_nome); estado['verificado'][aba_nome] = time.time()
+        geracao = estado['geracao'].get(aba_nome, 0)
+    def tarefa():
+        try:
+            revisao = revisao_excel_drive()
+            if revisao == revisao_local: return
+            df = ler_aba(aba_nome, revisao)
+            with estado['lock']:
+                # Um salvamento descartou o snapshot enquanto baixávamos: estes dados podem ser de antes dele
+                if estado['geracao'].get(aba_nome, 0) == geracao: gravar_snapshot(aba_nome, revisao, df)
+        except Exception: pass  # na próxima verificação tenta de novo
+        finally:
+            with estado['lock']: estado['em_andamento'].discard(aba_nome)
+    threading.Thread(target=tarefa, daemon=True).start()
+
 def carregar_excel_drive(aba_nome):
     try:
-        service = get_drive_service()
-        request = service.files().get_media(fileId=ID_ARQUIVO_EXCEL)
-        df = pd.read_excel(io.BytesIO(request.execute()), sheet_name=aba_nome)
-        df.columns = df.columns.str.strip()
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-        
-        if aba_nome == "Madeira Tratada":
-            cols_proibidas = ['pH da solução', 'Densidade  solução (g/cm³)', 'Temperatura', 'Concentração pela tabela']
-            df = df.drop(columns=[c for c in cols_proibidas if c in df.columns], errors='ignore')
-        elif aba_nome == "Solução Preservativa":
-            cols_proibidas = ['Diâmetro 1 (mm)', 'Massa 1 (g)', 'Retenção', 'Retenção Esp.']
-            df = df.drop(columns=[c for c in cols_proibidas if c in df.columns], errors='ignore')
-        
-        cols_data = ["Data de entrada", "Início da análise", "Fim da análise", "Data de Registro"]
-        for col in cols_data:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
-
-        return df
+        with Medicao("carregar", aba=aba_nome) as m:
+            # Partida rápida: se existe snapshot local, serve ele na hora e confere a revisão em segundo plano
+            info = snapshot_info(aba_nome)
+            if info:
+                try:
+                    with m.etapa("snapshot"): df = ler_snapshot(aba_nome, info['revisao'], info['formato']).copy(deep=False)
+                    atualizar_snapshot_em_segundo_plano(aba_nome, info['revisao'])
+                    m.dados.update(origem="snapshot", linhas=len(df))
+                    return df
+                except Exception: descartar_snapshot(aba_nome)
+            estado = estado_snapshots()
+            with estado['lock']: geracao = estado['geracao'].get(aba_nome, 0)
+            with m.etapa("revisao"): revisao = revisao_excel_drive()
+            with m.etapa("download"): baixar_workbook(revisao)
+            with m.etapa("leitura"): df = ler_aba(aba_nome, revisao)
+            with m.etapa("gravar_snapshot"), estado['lock']:
+                # Como na atualização em segundo plano: se um salvamento descartou o snapshot durante o download, não regrava a revisão velha
+                try:
+                    if estado['geracao'].get(aba_nome, 0) == geracao: gravar_snapshot(aba_nome, revisao, df)
+                except Exception: pass
+            m.dados.update(origem="drive", linhas=len(df))
+            return df
     except Exception as e: st.error(f"Erro Excel: {e}"); return pd.DataFrame()
 
-def salvar_excel_drive(df_to_save, aba_nome):
+# --- BUSCA (ÍNDICE POR REVISÃO) ---
+@st.cache_resource(max_entries=4, show_spinner=False)
+def indice_aba(aba_nome, revisao, _df):
+    return IndiceAmostras(_df)
+
+def indice_do_df(aba_nome, df):
+    revisao = df.attrs.get('revisao')
+    return indice_aba(aba_nome, revisao, df) if revisao else IndiceAmostras(df)
+
+# --- PAGINAÇÃO ---
+def ordenar_df(df, coluna, crescente=True):
+    if not coluna or coluna not in df.columns: return df
+    try: return df.sort_values(coluna, ascending=crescente, kind='stable', na_position='last')
+    except TypeError: return df.sort_values(coluna, ascending=crescente, kind='stable', na_position='last', key=lambda s: s.astype(str))
+
+def pagina_df(df, pagina, tamanho):
+    return df.iloc[(pagina - 1) * tamanho : pagina * tamanho]
+
+# --- EDIÇÕES NA TABELA (st.data_editor) ---
+def sem_categorias(df):
+    """Cópia com as colunas category como texto comum, para o st.data_editor aceitar valores novos (senão vira lista fechada)."""
+    cats = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: object for c in cats}) if cats else df
+
+def linhas_alteradas(df_base, df_editado, ignorar=("Selecionar",)):
+    """Índices das linhas que o st.data_editor realmente mudou (compara só as colunas exibidas)."""
+    comuns = df_editado.index.intersection(df_base.index)
+    cols = [c for c in df_editado.columns if c in df_base.columns and c not in ignorar]
+    if len(comuns) == 0 or not cols: return comuns[:0]
+    alterada = np.zeros(len(comuns), dtype=bool)
+    for col in cols:
+        a, b = df_base.loc[comuns, col], df_editado.loc[comuns, col]
+        if pd.api.types.is_datetime64_any_dtype(a) or pd.api.types.is_datetime64_any_dtype(b):
+            a, b = pd.to_datetime(a, errors='coerce'), pd.to_datetime(b, errors='coerce')
+        iguais = (a.to_numpy(dtype=object) == b.to_numpy(dtype=object)) | (a.isna().to_numpy() & b.isna().to_numpy())
+        alterada |= ~iguais
+    return comuns[alterada]
+
+def aplicar_edicoes(df, pendentes):
+    """Cópia do df com as edições pendentes ({Código UFV: {coluna: valor}}) aplicadas."""
+    df = df.copy()
+    if not pendentes or 'Código UFV' not in df.columns: return df
+    codigos = df['Código UFV'].astype(str)
+    for idx in df.index[codigos.isin(list(pendentes))]:
+        for col, val in pendentes[codigos[idx]].items():
+            if col not in df.columns: continue
+            try: df.at[idx, col] = val
+            except (TypeError, ValueError): df[col] = df[col].astype(object); df.at[idx, col] = val
+    return df
+
+def registrar_edicoes(pendentes, df_base, df_editado):
+    """Atualiza `pendentes` com as linhas da página que diferem da planilha carregada (e descarta as que voltaram ao original)."""
+    alteradas = set(linhas_alteradas(df_base, df_editado))
+    cols = [c for c in df_editado.columns if c in df_base.columns and c != "Selecionar"]
+    for idx in df_editado.index.intersection(df_base.index):
+        codigo = str(df_base.at[idx, 'Código UFV'])
+        if idx in alteradas: pendentes[codigo] = {c: df_editado.at[idx, c] for c in cols}
+        else: pendentes.pop(codigo, None)
+
+# --- GRAVAÇÃO (MESCLA NO planilha.py) ---
+class PlanilhaDoApp(PlanilhaDrive):
+    """A planilha no Drive pelos caches do app: a revisão é sempre consultada de novo e o download reaproveita os bytes
+    já baixados para leitura, se o arquivo não mudou no Drive desde então."""
+    def __init__(self): super().__init__(get_drive_service())
+    def revisao(self):
+        revisao_excel_drive.clear(); return revisao_excel_drive()
+    def baixar(self, revisao): return baixar_workbook(revisao)
+
+def gravar_planilha(alteracoes, aba_nome, m, revisao_base=None, novas=()):
+    """gravar_com_mescla (planilha.py) na planilha do Drive, limpando os caches da aba se algo foi gravado.
+    Não usa st.* (roda também na thread da fila). Retorna (células alteradas, conflitos, erros de cálculo)."""
+    alteradas, conflitos, erros = gravar_com_mescla(PlanilhaDoApp(), alteracoes, aba_nome, m, revisao_base, novas)
+    if alteradas: revisao_excel_drive.clear(); descartar_snapshot(aba_nome)
+    return alteradas, conflitos, erros
+
+def salvar_excel_drive(df_to_save, aba_nome, df_base=None):
+    """Salva na hora (bloqueia a sessão até o envio terminar). A tela usa a fila: salvar_em_segundo_plano.
+    df_base são as mesmas linhas como foram carregadas; sem ele, toda célula diferente da planilha é gravada.
+    As fórmulas rodam no gravar_com_mescla, em cima das linhas já mescladas."""
     try:
-        df_final = aplicar_formulas_excel(df_to_save)
-        
-        st.info("✅ Dados calculados! Salvando no Drive...")
-        
-        service = get_drive_service()
-        request = service.files().get_media(fileId=ID_ARQUIVO_EXCEL)
-        arquivo_original = io.BytesIO(request.execute())
-        
-        try: wb = openpyxl.load_workbook(arquivo_original)
-        except: st.error("Arquivo corrompido"); return
-
-        if aba_nome not in wb.sheetnames: st.error("Aba não encontrada"); return
-        ws = wb[aba_nome]
-        
-        col_map = {str(cell.value).strip(): idx for idx, cell in enumerate(ws[1], 1) if cell.value}
-        col_id_idx = col_map.get("Código UFV")
-        
-        excel_rows = {}
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), 2):
-            if row[col_id_idx - 1]: excel_rows[str(row[col_id_idx - 1]).strip()] = row_idx
-            
-        for index, row_df in df_final.iterrows():
-            codigo = str(row_df.get('Código UFV','')).strip()
-            linha = excel_rows.get(codigo)
-            if linha:
-                for col, val in row_df.items():
-                    c_idx = col_map.get(col)
-                    if c_idx: 
-                        if isinstance(val, (date, datetime)):
-                            ws.cell(row=linha, column=c_idx, value=val)
-                            ws.cell(row=linha, column=c_idx).number_format = 'DD/MM/YYYY'
-                        else:
-                            ws.cell(row=linha, column=c_idx, value=val)
-        
-        buf = io.BytesIO(); wb.save(buf); buf.seek(0)
-        media = MediaIoBaseUpload(buf, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', resumable=True)
-        service.files().update(fileId=ID_ARQUIVO_EXCEL, media_body=media, supportsAllDrives=True).execute()
-        st.toast("Salvo com Sucesso!", icon="💾"); st.cache_data.clear()
-        
+        with Medicao("salvar_excel", aba=aba_nome, linhas=len(df_to_save)) as m:
+            revisao_base = df_base.attrs.get('revisao') if df_base is not None else None
+            alteradas, conflitos, erros = gravar_planilha(alteracoes_celulas(df_base, df_to_save), aba_nome, m, revisao_base)
+        mostrar_erros_calculo(erros)
+        if alteradas == 0: st.toast("Nenhuma célula mudou, nada para enviar.", icon="ℹ️")
+        else: st.toast(f"Salvo com Sucesso! {alteradas} célula(s) alterada(s).", icon="💾")
+        for c in conflitos: st.warning(f"Conflito, mantido o valor do Drive: {descrever_conflito(c)}")
+        return alteradas
     except Exception as e: st.error(f"Erro Salvar: {e}")
 
-# --- PDF E HELPERS ---
-def clean_text(text): return str(text).encode('latin-1', 'replace').decode('latin-1') if not pd.isna(text) else ""
-def fmt_num(v): 
-    try: return "{:,.2f}".format(float(str(v).replace(",", "."))).replace(",", "X").replace(".", ",").replace("X", ".")
-    except: return str(v)
-def fmt_date(v):
-    if pd.isna(v) or v is None or str(v).strip() in ["", "NaT", "None"]: return "-"
-    if isinstance(v, (datetime, date)): return v.strftime("%d/%m/%Y")
-    s = str(v).strip().split(" ")[0]
-    for f in ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]:
-        try: return datetime.strptime(s, f).strftime("%d/%m/%Y")
-        except: continue
-    return s
-
-def get_val(d, keys):
-    dn = {k.strip().lower(): v for k, v in d.items()}
-    for k in keys:
-        if k.strip().lower() in dn:
-            val = dn[k.strip().lower()]
-            if not pd.isna(val) and str(val).strip() not in ["", "NaT"]: return val
-    return ""
-
-class RPDF(FPDF):
-    def header(self):
-        if os.path.exists("logo_ufv.png"): self.image("logo_ufv.png", 10, 8, 25)
-        if os.path.exists("logo_montana.png"): self.image("logo_montana.png", 155, 8, 45) 
-        self.set_y(12); self.set_font('Arial','B',14); self.cell(0,10,clean_text('Relatório de Ensaio'),0,1,'C')
-    def footer(self): self.set_y(-15); self.set_font('Arial','I',6); self.cell(0,10,clean_text(f'Página {self.page_no()}'),0,0,'C')
-    def field(self, label, valor, x, y, w, h=6, align='L', multi=False, bold_value=False):
-        self.set_xy(x, y); self.set_font('Arial', 'B', 8); self.cell(w, 3, clean_text(label), 0, 0, 'L')
-        self.set_xy(x, y+3)
-        if bold_value: self.set_font('Arial', 'B', 8)
-        else: self.set_font('Arial', '', 8)
-        if multi: self.rect(x, y+3, w, h); self.multi_cell(w, 4, clean_text(valor), 0, align)
-        else: self.cell(w, h, clean_text(valor), 1, 0, align)
-    def draw_chem_label(self, tipo):
-        x_start, y_start = self.get_x(), self.get_y(); self.set_font('Arial', '', 8)
-        def write_part(txt, size=8, offset_y=0):
-            self.set_font('Arial', '', size); w = self.get_string_width(txt); curr_x = self.get_x()
-            self.set_xy(curr_x, y_start + offset_y); self.cell(w, 6, clean_text(txt), 0, 0); self.set_xy(curr_x + w, y_start)
-        if tipo == "Cr": write_part("Teor de CrO"); write_part("3", size=5, offset_y=1.5); write_part(" (Cromo)")
-        elif tipo == "Cu": write_part("Teor de CuO (Cobre)")
-        elif tipo == "As": write_part("Teor de As"); write_part("2", size=5, offset_y=1.5); write_part("O"); write_part("5", size=5, offset_y=1.5); write_part(" (Arsênio)")
-        self.set_xy(x_start, y_start); self.cell(40, 6, "", 1, 0)
-
-def gerar_pdf(d):
-    pdf = RPDF(); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=15)
-    y = 30
-    pdf.field("Data de Entrada", fmt_date(get_val(d, ["Data de entrada", "Entrada"])), 10, y, 40, align='C')
-    pdf.field("Número ID", clean_text(get_val(d, ["Código UFV", "ID"])), 150, y-5, 50, align='C')
-    pdf.field("Data de Emissão", fmt_date(get_val(d, ["Data de Registro", "Fim da análise"])), 150, y+8, 50, align='C')
-    y += 20; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(0, 5, clean_text("DADOS DO CLIENTE"), 0, 1, 'L')
-    y += 6; pdf.field("Cliente", get_val(d, ["Nome do Cliente"]), 10, y, 190)
-    y += 11; pdf.field("Cidade/UF", f"{get_val(d,['Cidade'])}/{get_val(d,['Estado'])}", 10, y, 90)
-    pdf.field("E-mail", get_val(d, ["E-mail"]), 105, y, 95)
-    y += 15; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(0, 5, clean_text("IDENTIFICAÇÃO DA AMOSTRA"), 0, 1, 'L')
-    y += 6; pdf.field("Ref. Cliente", get_val(d, ["Indentificação de Amostra"]), 10, y, 190)
-    y += 11; pdf.field("Madeira", get_val(d, ["Madeira"]), 10, y, 90)
-    pdf.field("Produto", get_val(d, ["Produto"]), 105, y, 95)
-    y += 11; pdf.field("Aplicação", get_val(d, ["Aplicação"]), 10, y, 60)
-    pdf.field("Norma ABNT", get_val(d, ["Norma"]), 75, y, 60)
-    ret_esp = get_val(d, ["Retenção", "Retenção Esp."])
-    pdf.field("Retenção Esp.", fmt_num(ret_esp), 140, y, 60, align='C')
-    y += 20; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(190, 6, clean_text("RESULTADOS DE RETENÇÃO"), 1, 1, 'C')
-    pdf.set_font('Arial', 'B', 7); x=10; cy=pdf.get_y()
-    pdf.cell(40, 10, clean_text("Ingredientes ativos"), 1, 0, 'C'); pdf.cell(30, 10, clean_text("Resultado (kg/m3)"), 1, 0, 'C'); pdf.cell(80, 5, clean_text("Balanceamento químico"), 1, 0, 'C')
-    pdf.set_xy(x+150, cy); pdf.cell(40, 10, clean_text("Método"), 1, 0, 'C'); pdf.set_xy(x+70, cy+5); pdf.cell(30, 5, clean_text("Resultados (%)"), 1, 0, 'C'); pdf.cell(50, 5, clean_text("Padrões"), 1, 0, 'C')
-    pdf.set_xy(x, cy+10); y_dados_inicio = cy+10
-    kg_cr=fmt_num(get_val(d,["Retenção Cromo (Kg/m³)","Retenção Cromo"])); kg_cu=fmt_num(get_val(d,["Retenção Cobre (Kg/m³)","Retenção Cobre"])); kg_as=fmt_num(get_val(d,["Retenção Arsênio (Kg/m³)","Retenção Arsênio"]))
-    pc_cr=fmt_num(get_val(d,["Balanço Cromo %","Balanço Cromo"])); pc_cu=fmt_num(get_val(d,["Balanço Cobre %","Balanço Cobre"])); pc_as=fmt_num(get_val(d,["Balanço Arsênio %","Balanço Arsênio"]))
-    pdf.set_font('Arial', '', 8)
-    def row_data_custom(tipo, k, p, mn, mx):
-        pdf.draw_chem_label(tipo); pdf.cell(30, 6, k, 1, 0, 'C'); pdf.cell(30, 6, p, 1, 0, 'C'); pdf.cell(25, 6, mn, 1, 0, 'C'); pdf.cell(25, 6, mx, 1, 0, 'C'); pdf.set_x(pdf.get_x() + 40); pdf.ln(6)
-    pdf.set_xy(160, y_dados_inicio); pdf.cell(40, 18, clean_text("Metodo UFV 01"), 1, 0, 'C'); pdf.set_xy(10, y_dados_inicio)
-    row_data_custom("Cr", kg_cr, pc_cr, "41,8", "53,2"); row_data_custom("Cu", kg_cu, pc_cu, "15,2", "22,8"); row_data_custom("As", kg_as, pc_as, "27,3", "40,7")
-    try: tot_kg = float(kg_cr.replace(",",".")) + float(kg_cu.replace(",",".")) + float(kg_as.replace(",","."))
-    except: tot_kg = 0
-    try: soma_pct = float(pc_cr.replace(",",".")) + float(pc_cu.replace(",",".")) + float(pc_as.replace(",","."))
-    except: soma_pct = 100.00
-    pdf.set_font('Arial', 'B', 8); pdf.cell(40, 6, clean_text("RETENÇÃO TOTAL"), 1, 0, 'L'); pdf.cell(30, 6, fmt_num(tot_kg), 1, 0, 'C'); pdf.cell(30, 6, fmt_num(soma_pct), 1, 0, 'C'); pdf.cell(90, 6, clean_text("Nota: Resultados restritos as amostras"), 1, 1, 'C')
-    y = pdf.get_y() + 5; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(190, 6, clean_text("RESULTADOS DE PENETRAÇÃO"), 0, 1, 'C'); y += 7
-    tipo_correto = get_val(d, ["Descrição Grau", "Descrição do Grau", "Grau Descricao"])
-    pdf.field("Grau", get_val(d, ["Grau"]), 10, y, 30, align='C'); pdf.field("Tipo", tipo_correto, 45, y, 50, align='C')
-    pdf.set_xy(100, y); pdf.set_font('Arial', 'B', 8); pdf.cell(90, 3, clean_text("Descrição"), 0, 0, 'L'); pdf.set_xy(100, y+3); pdf.set_font('Arial', '', 8); pdf.rect(100, y+3, 100, 12); pdf.multi_cell(100, 4, clean_text(get_val(d, ["Descrição Penetração"])), 0, 'L')
-    y += 20; obs = get_val(d, ["Observação", "Obs"])
-    if obs: pdf.set_y(y); pdf.field("Observações", obs, 10, y, 190, 12, 'L', multi=True, bold_value=True)
-    pdf.set_y(-35); pdf.set_font('Arial', '', 9); pdf.cell(0, 5, clean_text("Dr. Vinicius Resende de Castro - Supervisor do laboratório"), 0, 1, 'C')
-    return pdf.output(dest='S').encode('latin-1')
+# --- FILA DE SALVAMENTO (SEGUNDO PLANO) ---
+class FilaSalvamento:
+    """Células alteradas esperando gravação, por aba. Uma thread por processo junta tudo o que chegou
+    (de vários cliques ou usuários) e faz uma única ida e volta do workbook por aba."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pendentes = {}  # aba -> {'alteracoes': {Código UFV: {coluna: (carregado, novo)}}, 'origem': {(código, coluna): id}, 'pedidos': [id], 'revisao_base', 'novas': {código}}
+        self.pedidos = {}    # id -> {'id', 'aba', 'usuario', 'amostras', 'estado', 'celulas', 'conflitos', 'erros_calculo', 'erro', 'pedido_em', 'concluido_em', 'revisao_base', 'novas'}
+        self.seq = 0
+        threading.Thread(target=self.trabalhar, daemon=True).start()
+
+    def enfileirar(self, alteracoes, aba_nome, usuario=None, revisao_base=None, novas=()):
+        """Põe as alterações na fila e retorna na hora o id do pedido. Só entram as células editadas (entradas): as fórmulas
+        rodam uma vez na gravação, depois de juntar os pedidos e mesclar com a planilha. A mesma célula em dois pedidos fica com o valor mais
+        recente se o segundo partiu do valor do primeiro (ou chegou ao mesmo valor); senão é conflito do segundo pedido.
+        `novas` são os códigos que podem virar linhas novas na aba (importação)."""
+        with self.cond:
+            self.seq += 1
+            pedido = {'id': self.seq, 'aba': aba_nome, 'usuario': usuario, 'amostras': len(alteracoes), 'estado': 'na fila', 'celulas': None,
+                      'conflitos': [], 'erros_calculo': [], 'erro': None, 'pedido_em': time.time(), 'concluido_em': None, 'revisao_base': revisao_base, 'novas': set(novas)}
+            self.pedidos[self.seq] = pedido
+            fila = self.pendentes.setdefault(aba_nome, {'alteracoes': {}, 'origem': {}, 'pedidos': [], 'revisao_base': revisao_base, 'novas': set()})
+            fila['novas'].update(novas)
+            for codigo, celulas in alteracoes.items():
+                na_fila = fila['alteracoes'].setdefault(codigo, {})
+                for col, (antes, novo) in celulas.items():
+                    if col in na_fila:
+                        antes_fila, novo_fila = na_fila[col]
+                        if antes is not SEM_BASE and not mesmo_valor(antes, novo_fila) and not mesmo_valor(novo, novo_fila):
+                            pedido['conflitos'].append({'codigo': codigo, 'coluna': col, 'planilha': novo_fila, 'carregado': antes, 'novo': novo}); continue
+                        antes = antes_fila
+                    na_fila[col] = (antes, novo); fila['origem'][(codigo, col)] = self.seq
+            fila['pedidos'].append(self.seq)
+            if revisao_base != fila['revisao_base']: fila['revisao_base'] = None  # pedidos de revisões diferentes: sempre três vias
+            self.cond.notify()
+            return self.seq
+
+    def estado(self, pedido_id):
+        with self.cond:
+            p = self.pedidos.get(pedido_id)
+            return dict(p, conflitos=list(p['conflitos']), novas=set(p['novas'])) if p else None
+
+    def trabalhar(self):
+        while True:
+            try:
+                with self.cond:
+                    while not self.pendentes: self.cond.wait()
+                time.sleep(SALVAMENTO_JANELA_S)  # espera cliques que chegam logo em seguida para ir tudo no mesmo envio
+                with self.cond: lotes, self.pendentes = self.pendentes, {}
+                for aba_nome, lote in lotes.items():
+                    try: self.gravar(aba_nome, lote)
+                    except Exception as e: self.falhar(lote, e)
+                self.limpar_antigos()
+            except Exception: time.sleep(1)  # é a única thread da fila: se morrer, todo pedido seguinte fica "na fila" para sempre
+
+    def gravar(self, aba_nome, lote):
+        with self.cond:
+            for i in lote['pedidos']: self.pedidos[i]['estado'] = 'salvando'
+        celulas, conflitos, erros, erro = None, [], [], None
+        try:
+            with Medicao("salvar_excel", aba=aba_nome, linhas=len(lote['alteracoes']), pedidos=len(lote['pedidos'])) as m:
+                celulas, conflitos, erros = gravar_planilha(lote['alteracoes'], aba_nome, m, lote['revisao_base'], lote['novas'])
+        except Exception as e: erro = str(e)
+        with self.cond:
+            for c in conflitos: self.pedidos[lote['origem'][(c['codigo'], c['coluna'])]]['conflitos'].append(c)
+            for i in lote['pedidos']:
+                p = self.pedidos[i]
+                p.update(estado='erro' if erro else 'salvo', celulas=celulas, erros_calculo=erros, erro=erro, juntos=len(lote['pedidos']), concluido_em=time.time())
+
+    def falhar(self, lote, erro):
+        """Erro fora do gravar_planilha: os pedidos do lote que ainda não terminaram viram erro (não ficam "salvando")."""
+        with self.cond:
+            for i in lote['pedidos']:
+                p = self.pedidos.get(i)
+                if p and p['estado'] not in ('salvo', 'erro'): p.update(estado='erro', erro=str(erro), concluido_em=time.time())
+
+    def limpar_antigos(self, idade=3600):
+        with self.cond:
+            for i in [i for i, p in self.pedidos.items() if p['concluido_em'] and time.time() - p['concluido_em'] > idade]: del self.pedidos[i]
+
+@st.cache_resource(show_spinner=False)
+def fila_salvamento():
+    return FilaSalvamento()
+
+def salvar_em_segundo_plano(df_to_save, aba_nome, df_base):
+    """Põe na fila só as células editadas em relação a df_base (as mesmas linhas como foram carregadas); as fórmulas rodam
+    na gravação (etapa "formulas" da medição salvar_excel) e os erros de cálculo aparecem no status do pedido.
+    As células ficam sobrepostas à planilha nesta sessão até o pedido terminar. Retorna o id do pedido."""
+    alteracoes = alteracoes_celulas(df_base, df_to_save)
+    pedido = fila_salvamento().enfileirar(alteracoes, aba_nome, st.session_state.get('user'), df_base.attrs.get('revisao'))
+    st.session_state.setdefault('salvamentos', {})[pedido] = alteracoes
+    return pedido
+
+def edicoes_em_andamento():
+    """{Código UFV: {coluna: valor}} dos pedidos desta sessão que ainda não foram gravados."""
+    edicoes = {}
+    for alteracoes in st.session_state.get('salvamentos', {}).values():
+        for codigo, celulas in alteracoes.items(): edicoes.setdefault(codigo, {}).update({col: novo for col, (_, novo) in celulas.items()})
+    return edicoes
+
+# --- IMPORTAÇÃO EM LOTE (RESULTADOS DOS INSTRUMENTOS) ---
+IMPORTACAO_BLOCO = 500  # linhas do arquivo processadas por vez
+APELIDOS_IMPORTACAO = {
+    "codigo": "Código UFV", "código": "Código UFV", "codigo ufv": "Código UFV", "amostra": "Código UFV",
+    "cr": "Cromo (%)", "cr (%)": "Cromo (%)", "cr %": "Cromo (%)", "cromo": "Cromo (%)", "cromo %": "Cromo (%)",
+    "cu": "Cobre (%)", "cu (%)": "Cobre (%)", "cu %": "Cobre (%)", "cobre": "Cobre (%)", "cobre %": "Cobre (%)",
+    "as": "Arsênio (%)", "as (%)": "Arsênio (%)", "as %": "Arsênio (%)", "arsenio": "Arsênio (%)", "arsênio": "Arsênio (%)", "arsênio %": "Arsênio (%)",
+}
+
+def chave_coluna(nome):
+    return re.sub(r'\s+', ' ', str(nome)).strip().lower()
+
+def vazio(v):
+    return v is None or (isinstance(v, float) and np.isnan(v)) or (isinstance(v, str) and v.strip() == "")
+
+def blocos_importacao(arquivo, nome_arquivo, tamanho=IMPORTACAO_BLOCO):
+    """Lê o CSV/XLSX exportado pelos instrumentos em blocos de `tamanho` linhas, sem carregar o arquivo inteiro.
+    CSV: separador detectado sozinho, UTF-8 ou Latin-1. XLSX: primeira aba, primeira linha é o cabeçalho."""
+    if nome_arquivo.lower().endswith((".xlsx", ".xlsm")):
+        wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = wb.worksheets[0].iter_rows(values_only=True)
+            cabecalho = [str(c).strip() if c is not None else f"_{i}" for i, c in enumerate(next(linhas, ()))]
+            n = len(cabecalho); bloco = []
+            for linha in linhas:
+                if all(v is None for v in linha): continue
+                bloco.append(list(linha[:n]) + [None] * (n - len(linha)))
+                if len(bloco) == tamanho: yield pd.DataFrame(bloco, columns=cabecalho); bloco = []
+            if bloco: yield pd.DataFrame(bloco, columns=cabecalho)
+        finally: wb.close()
+        return
+    inicio = arquivo.read(65536); arquivo.seek(0)
+    try: codecs.getincrementaldecoder("utf-8")().decode(inicio); encoding = "utf-8-sig"
+    except UnicodeDecodeError: encoding = "latin-1"
+    yield from pd.read_csv(arquivo, sep=None, engine="python", dtype=str, encoding=encoding, chunksize=tamanho, skip_blank_lines=True)
+
+def normalizar_importacao(bloco, colunas_planilha):
+    """Renomeia as colunas do arquivo para as da planilha (sem diferenciar maiúsculas/espaços, e com os apelidos
+    usuais dos instrumentos) e converte números com vírgula e datas. Retorna (bloco, colunas ignoradas)."""
+    conhecidas = {chave_coluna(c): c for c in colunas_planilha}
+    for apelido, col in APELIDOS_IMPORTACAO.items(): conhecidas.setdefault(apelido, col)
+    renomear = {c: conhecidas[chave_coluna(c)] for c in bloco.columns if chave_coluna(c) in conhecidas}
+    ignoradas = [str(c) for c in bloco.columns if c not in renomear and not str(c).startswith("_")]
+    bloco = bloco[list(renomear)].rename(columns=renomear)
+    bloco = bloco.loc[:, ~bloco.columns.duplicated()].reset_index(drop=True)
+    for col in bloco.columns:
+        texto = bloco[col].astype(object).where(bloco[col].notna(), "").astype(str).str.strip()
+        if col in COLUNAS_NUMERICAS or col == 'Grau':
+            num = pd.to_numeric(texto.str.replace(",", ".", regex=False), errors='coerce')
+            bloco[col] = num.astype(object).where(num.notna(), texto.where(texto != "", None))
+        elif col in COLS_DATA:
+            datas = pd.to_datetime(bloco[col], errors='coerce', dayfirst=True).dt.date
+            bloco[col] = datas.astype(object).where(datas.notna(), None)
+        elif col == "Código UFV": bloco[col] = texto
+    return bloco, ignoradas
+
+def preparar_importacao(blocos, df_atual, ao_progredir=None):
+    """Junta os blocos do arquivo com as amostras já carregadas, bloco a bloco (as fórmulas rodam na gravação).
+    Amostras existentes recebem só os valores preenchidos no arquivo; as outras viram linhas novas.
+    Retorna (alterações por célula para a fila, resumo)."""
+    atuais = df_atual.drop(columns=['Selecionar'], errors='ignore')
+    posicao = {c: i for i, c in enumerate(atuais['Código UFV'].astype(str).str.strip())}
+    alteracoes, novas, atualizadas = {}, set(), set()
+    resumo = {'linhas': 0, 'sem_codigo': 0, 'ignoradas': set()}
+    for bloco in blocos:
+        bloco, ignoradas = normalizar_importacao(bloco, list(atuais.columns))  # só o cabeçalho da planilha: o resto seria descartado na gravação
+        resumo['ignoradas'].update(ignoradas); resumo['linhas'] += len(bloco)
+        if 'Código UFV' not in bloco.columns: raise ValueError("o arquivo não tem a coluna Código UFV")
+        resumo['sem_codigo'] += int((bloco['Código UFV'] == "").sum())
+        bloco = bloco[bloco['Código UFV'] != ""].drop_duplicates('Código UFV', keep='last')
+        existe = bloco['Código UFV'].isin(posicao).to_numpy()
+
+        base = atuais.iloc[[posicao[c] for c in bloco.loc[existe, 'Código UFV']]]
+        edicoes = {l['Código UFV']: {k: v for k, v in l.items() if not vazio(v)} for l in bloco[existe].to_dict('records')}
+        for codigo, celulas in alteracoes_celulas(base, aplicar_edicoes(base, edicoes)).items():
+            alteracoes.setdefault(codigo, {}).update(celulas); atualizadas.add(codigo)
+        if (~existe).any():
+            for codigo, celulas in alteracoes_celulas(None, bloco[~existe].reset_index(drop=True)).items():
+                alteracoes.setdefault(codigo, {}).update({col: v for col, v in celulas.items() if v[1] is not None}); novas.add(codigo)
+        if ao_progredir: ao_progredir(resumo['linhas'])
+    resumo.update(novas=novas, atualizadas=atualizadas - novas)
+    return alteracoes, resumo
+
+@st.fragment(run_every=1)
+def acompanhar_salvamentos():
+    """Atualiza a cada segundo enquanto há pedidos desta sessão na fila. Quando um termina, recarrega a página com a planilha nova."""
+    salvamentos = st.session_state.get('salvamentos', {})
+    concluidos = st.session_state.setdefault('salvamentos_concluidos', [])
+    fila = fila_salvamento(); terminou = False
+    for pedido in list(salvamentos):
+        p = fila.estado(pedido)
+        if p is None or p['estado'] in ('salvo', 'erro'):
+            alteracoes = salvamentos.pop(pedido); terminou = True
+            if p and p['estado'] == 'erro': p['alteracoes'] = alteracoes  # a fila não guarda as edições: o "Tentar de novo" sai daqui
+            if p: concluidos.append(p)
+        else: st.info(f"⏳ Pedido {pedido}: {p['amostras']} amostra(s) {'na fila' if p['estado'] == 'na fila' else 'sendo salvas no Drive'}...")
+    if terminou: st.rerun()
+
+def status_salvamentos():
+    if st.session_state.get('salvamentos'): acompanhar_salvamentos()
+    concluidos = st.session_state.get('salvamentos_concluidos', [])
+    for p in list(concluidos):
+        if p['estado'] == 'erro':
+            c_msg, c_novo, c_descartar = st.columns([4, 1, 1])
+            with c_msg: st.error(f"Pedido {p['id']} ({p['amostras']} amostra(s)) não foi salvo: {p['erro']}")
+            with c_novo:
+                if st.button("Tentar de novo", key=f"refazer_{p['id']}"):
+                    novo = fila_salvamento().enfileirar(p['alteracoes'], p['aba'], p['usuario'], p['revisao_base'], p['novas'])
+                    st.session_state.setdefault('salvamentos', {})[novo] = p['alteracoes']
+                    concluidos.remove(p); st.rerun()
+            with c_descartar:
+                if st.button("Descartar", key=f"descartar_{p['id']}"): concluidos.remove(p); st.rerun()
+        elif p['conflitos']:
+            with st.expander(f"⚠️ Pedido {p['id']} salvo ({p['celulas'] or 0} célula(s)) com {len(p['conflitos'])} conflito(s): outra pessoa mudou as mesmas células e ficou o valor dela", expanded=True):
+                for c in p['conflitos'][:50]: st.write(descrever_conflito(c))
+                if st.button("Ok", key=f"conflitos_ok_{p['id']}"): concluidos.remove(p); st.rerun()
+        elif p.get('erros_calculo'):
+            with st.expander(f"⚠️ Pedido {p['id']} salvo ({p['celulas'] or 0} célula(s)) com {len(p['erros_calculo'])} erro(s) de cálculo", expanded=True):
+                for e in p['erros_calculo'][:50]: st.write(e)
+                if st.button("Ok", key=f"erros_ok_{p['id']}"): concluidos.remove(p); st.rerun()
+        elif time.time() - p['concluido_em'] > 30: concluidos.remove(p)
+        elif p['celulas'] == 0: st.caption(f"Pedido {p['id']}: nenhuma célula mudou, nada enviado.")
+        else: st.success(f"💾 Pedido {p['id']} salvo: {p['celulas']} célula(s) alterada(s)" + (f" (um só envio para {p['juntos']} pedidos)." if p.get('juntos', 1) > 1 else "."))
 
 # --- MAIN ---
 def main():
@@ -393,7 +554,12 @@ def main():
     config = carregar_config()
 
     if menu=="Madeira Tratada":
+        status_salvamentos()
         df=carregar_excel_drive("Madeira Tratada")
+        # Índice da busca com a planilha como foi carregada: ele é compartilhado por todas as sessões nesta revisão
+        indice = indice_do_df("Madeira Tratada", df)
+        em_andamento = edicoes_em_andamento()
+        if em_andamento and not df.empty: df = aplicar_edicoes(df, em_andamento)  # o que está na fila aparece já editado
         if not df.empty:
             if "Selecionar" not in df.columns: df.insert(0,"Selecionar",False)
             
@@ -413,9 +579,41 @@ def main():
             cols_finais = ["Selecionar", "Código UFV"] + cols_visiveis
             cols_finais = [c for c in cols_finais if c in df.columns]
 
+            if st.session_state['user'] in ["admin", "Lpm"]:
+                with st.expander("📥 Importar resultados dos instrumentos (CSV/XLSX)"):
+                    st.caption("Uma linha por amostra com a coluna Código UFV. Amostras que já existem recebem só os valores preenchidos no arquivo; as novas entram no fim da planilha. Tudo vai num único salvamento.")
+                    arquivo = st.file_uploader("Arquivo exportado", type=["csv", "xlsx"], key="arquivo_importacao")
+                    resumo_anterior = st.session_state.pop('importacao_resumo', None)
+                    if resumo_anterior: st.success(resumo_anterior)
+                    if arquivo is not None and st.button("📥 IMPORTAR E SALVAR", type="primary"):
+                        progresso = st.empty()
+                        try:
+                            with Medicao("importar", arquivo=arquivo.name) as m:
+                                with m.etapa("ler_e_calcular"):
+                                    alteracoes, resumo = preparar_importacao(blocos_importacao(arquivo, arquivo.name), df, ao_progredir=lambda n: progresso.caption(f"{n} linha(s) lidas..."))
+                                m.dados.update(linhas=resumo['linhas'], novas=len(resumo['novas']), atualizadas=len(resumo['atualizadas']))
+                            for aviso in ([f"{resumo['sem_codigo']} linha(s) sem Código UFV foram ignoradas."] if resumo['sem_codigo'] else []) + \
+                                         ([f"Colunas que não existem na planilha foram ignoradas: {', '.join(sorted(resumo['ignoradas']))}"] if resumo['ignoradas'] else []):
+                                st.warning(aviso)
+                            if not alteracoes: st.info("Nada a importar: o arquivo não muda nenhuma amostra.")
+                            else:
+                                pedido = fila_salvamento().enfileirar(alteracoes, "Madeira Tratada", st.session_state.get('user'), df.attrs.get('revisao'), resumo['novas'])
+                                st.session_state.setdefault('salvamentos', {})[pedido] = alteracoes
+                                st.session_state['importacao_resumo'] = f"Pedido {pedido}: {len(resumo['novas'])} amostra(s) nova(s) e {len(resumo['atualizadas'])} atualizada(s) de {resumo['linhas']} linha(s) do arquivo."
+                                if not resumo['sem_codigo'] and not resumo['ignoradas']: st.rerun()
+                        except Exception as e: st.error(f"Erro na importação: {e}")
+
             st.markdown("### 🔎 Buscar/Editar Amostra")
+            if st.session_state['user'] in ["admin", "Lpm"]: st.caption("A tabela edita amostras que já existem. Para incluir amostras novas, use o painel 📥 Importar resultados dos instrumentos.")
             col_busca, col_info = st.columns([1, 3])
-            with col_busca: numero_busca = st.text_input("Digite o número (ex: 620)", placeholder="Busque para Editar...")
+            with col_busca: numero_busca = st.text_input("Digite o número (ex: 620 ou 600-650)", placeholder="Busque para Editar...")
+            with st.expander("🔍 Filtros (Cliente, Aplicação, Data de entrada)"):
+                f_cli, f_apl, f_data = st.columns(3)
+                with f_cli: cliente_busca = st.text_input("Cliente contém")
+                with f_apl: aplicacao_busca = st.multiselect("Aplicação", indice.valores_originais.get("Aplicação", []))
+                with f_data: datas_busca = st.date_input("Data de entrada (de/até)", value=(), format="DD/MM/YYYY")
+            datas_busca = tuple(datas_busca) if isinstance(datas_busca, (list, tuple)) and len(datas_busca) == 2 else ()
+            filtrando = bool(numero_busca or cliente_busca or aplicacao_busca or datas_busca)
             
             column_config_dates = {
                 "Data de entrada": st.column_config.DateColumn("Data de entrada", format="DD/MM/YYYY"),
@@ -424,65 +622,92 @@ def main():
                 "Data de Registro": st.column_config.DateColumn("Data de Registro", format="DD/MM/YYYY"),
             }
 
-            if numero_busca:
-                termo = f"UFV-M-{numero_busca}"
-                df_filtrado = df[df['Código UFV'].astype(str).str.contains(termo, case=False, na=False)]
-                if df_filtrado.empty: df_filtrado = df[df['Código UFV'].astype(str).str.contains(numero_busca, case=False, na=False)]
-                
-                with col_info: st.info(f"Encontrados: {len(df_filtrado)}. Edite e clique em CALCULAR.")
-                
-                df_view = st.data_editor(
-                    df_filtrado[cols_finais], 
-                    num_rows="dynamic", 
-                    use_container_width=True, 
-                    key="tabela_filtrada",
-                    column_config=column_config_dates
-                )
-                
-                if st.session_state['user'] in ["admin", "Lpm"]:
-                    if st.button("🧮 CALCULAR E SALVAR (Mesclar)", type="primary"):
-                        df.update(df_view)
-                        salvar_excel_drive(df, "Madeira Tratada")
-                        st.success("Atualizado!")
-                        st.rerun()
-            else:
-                with col_info: st.info("Mostrando tabela completa.")
-                df_view = st.data_editor(
-                    df[cols_finais], 
-                    num_rows="dynamic", 
-                    use_container_width=True, 
-                    key="tabela_completa",
-                    column_config=column_config_dates
-                )
-                
-                if st.session_state['user'] in ["admin", "Lpm"]:
-                    if st.button("🧮 CALCULAR E SALVAR TUDO", type="primary"): 
-                        df.update(df_view)
-                        salvar_excel_drive(df, "Madeira Tratada")
+            # Tabela paginada no servidor (completa ou filtrada): só a página atual vai para o navegador.
+            # Edições de cada página ficam em `edicoes_pendentes` até salvar, também ao trocar de busca.
+            df_filtrado = df.iloc[indice.filtrar(numero_busca, cliente_busca, aplicacao_busca, datas_busca)] if filtrando else df
+            pendentes = st.session_state.setdefault('edicoes_pendentes', {})
+            selecionados = st.session_state.setdefault('selecionados', set())
+            aviso = f" {len(pendentes)} amostra(s) editada(s) aguardando salvar." if pendentes else ""
+            with col_info:
+                if filtrando: st.info(f"Encontrados: {len(df_filtrado)}. Edite e clique em CALCULAR.{aviso}")
+                else: st.info(f"Mostrando tabela completa ({len(df)} amostras).{aviso}")
+            p_ord, p_dir, p_tam, p_pag = st.columns([2, 1, 1, 1])
+            with p_ord: ordenar_por = st.selectbox("Ordenar por", ["(ordem da planilha)"] + cols_finais[1:])
+            with p_dir: crescente = st.radio("Ordem", ["Crescente", "Decrescente"], horizontal=True) == "Crescente"
+            with p_tam: tamanho = st.selectbox("Linhas por página", TAMANHOS_PAGINA, index=TAMANHOS_PAGINA.index(TAMANHO_PAGINA_PADRAO))
+            total_paginas = max(1, -(-len(df_filtrado) // tamanho))
+            with p_pag: pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1)
+            
+            base_pagina = sem_categorias(pagina_df(ordenar_df(df_filtrado, ordenar_por, crescente), pagina, tamanho)[cols_finais])
+            exibida = aplicar_edicoes(base_pagina, pendentes)
+            exibida['Selecionar'] = exibida['Código UFV'].astype(str).isin(selecionados)
+            filtro = (numero_busca, cliente_busca, tuple(aplicacao_busca), datas_busca) if filtrando else ()
+            df_view = st.data_editor(
+                exibida, 
+                num_rows="fixed",  # linha digitada aqui não tem como virar amostra: amostras novas entram pela importação
+                use_container_width=True, 
+                key=f"tabela_{filtro}_{ordenar_por}_{crescente}_{tamanho}_{pagina}",
+                column_config=column_config_dates
+            )
+            registrar_edicoes(pendentes, base_pagina, df_view)
+            for codigo, marcado in zip(df_view['Código UFV'].astype(str), df_view['Selecionar']):
+                if marcado == True: selecionados.add(codigo)
+                else: selecionados.discard(codigo)
+            
+            if st.session_state['user'] in ["admin", "Lpm"]:
+                if st.button("🧮 CALCULAR E SALVAR TUDO", type="primary"): 
+                    if not pendentes: st.info("Nenhuma alteração para salvar.")
+                    else:
+                        df_editado = aplicar_edicoes(df, pendentes)
+                        alteradas = df_editado.index[df_editado['Código UFV'].astype(str).isin(list(pendentes))]
+                        salvar_em_segundo_plano(df_editado.loc[alteradas].copy(), "Madeira Tratada", df.loc[alteradas])
+                        pendentes.clear()
                         st.rerun()
 
-            if numero_busca:
-                current_df = df[df['Código UFV'].isin(df_filtrado['Código UFV'])]
-                sel_codes = df_view[df_view['Selecionar']==True]['Código UFV'].tolist()
-                sel = current_df[current_df['Código UFV'].isin(sel_codes)]
-            else:
-                sel_codes = df_view[df_view['Selecionar']==True]['Código UFV'].tolist()
-                sel = df[df['Código UFV'].isin(sel_codes)]
+            sel = df_filtrado[df_filtrado['Código UFV'].astype(str).isin(selecionados)]
 
             st.divider()
-            if not sel.empty:
+            if len(sel) > 1:
+                st.subheader(f"📦 Gerar Relatórios em Lote ({len(sel)} amostras)")
+                codigos_lote = tuple(sel['Código UFV'].astype(str))
+                if st.button("📦 GERAR TODOS (ZIP)", type="primary"):
+                    barra = st.progress(0.0, text="Gerando relatórios...")
+                    linhas = sel.to_dict('records')
+                    with Medicao("gerar_pdfs_lote", pdfs=len(linhas)) as m:
+                        resultados = gerar_pdfs_lote(linhas, ao_progredir=lambda feitos, total: barra.progress(feitos/total, text=f"Gerando relatórios... {feitos}/{total}"))
+                        m.dados['falhas'] = sum(1 for _, _, erro in resultados if erro)
+                    for nome, _, erro in resultados:
+                        if erro: st.error(f"Erro na geração de {nome}: {erro}")
+                    st.session_state['lote_pdf'] = {'codigos': codigos_lote, 'arquivos': [(pdf, nome, get_val(l, ["Data de entrada"]), chave_relatorio(l)) for l, (nome, pdf, _) in zip(linhas, resultados) if pdf is not None]}
+                lote = st.session_state.get('lote_pdf')
+                if lote and lote['codigos'] == codigos_lote and lote['arquivos']:
+                    c_down, c_cloud = st.columns(2)
+                    with c_down: st.download_button(f"⬇️ BAIXAR ZIP ({len(lote['arquivos'])} PDFs)", montar_zip([(nome, pdf) for pdf, nome, _, _ in lote['arquivos']]), f"Relatorios_{date.today():%Y-%m-%d}.zip", "application/zip", type="primary")
+                    with c_cloud:
+                        if st.button(f"☁️ SALVAR TODOS NO DRIVE ({len(lote['arquivos'])})"):
+                            barra = st.progress(0.0, text="Enviando para o Drive...")
+                            try:
+                                envios = salvar_pdfs_lote(lote['arquivos'], ao_progredir=lambda feitos, total: barra.progress(feitos/total, text=f"Enviando para o Drive... {feitos}/{total}"))
+                                situacoes = [r['situacao'] for r in envios if r['ok']]
+                                if situacoes:
+                                    partes = [f"{situacoes.count('novo')} novo(s)", f"{situacoes.count('atualizado')} atualizado(s)", f"{situacoes.count('igual')} já estavam iguais no Drive"]
+                                    st.success(f"{len(situacoes)} arquivo(s) no Drive: " + ", ".join(partes) + ".")
+                                for r in envios:
+                                    if not r['ok']: st.error(f"{r['nome']} ({r['pasta']}): {r['erro']}")
+                            except Exception as e: st.error(f"Erro ao salvar PDFs: {e}")
+            elif not sel.empty:
                 st.subheader("📄 Gerar Relatório")
                 try:
                     l=sel.iloc[0].to_dict()
-                    pdf_bytes=gerar_pdf(l)
+                    with Medicao("gerar_pdf", pdfs=1): chave_pdf, pdf_bytes = pdf_relatorio(l)
                     nome_arquivo = f"{l.get('Código UFV','Relatorio')}.pdf"
                     c_down, c_cloud = st.columns(2)
                     with c_down: st.download_button("⬇️ BAIXAR PDF (PC)", pdf_bytes, nome_arquivo, "application/pdf", type="primary")
                     with c_cloud:
-                        if st.button("☁️ SALVAR NO DRIVE COMPARTILHADO"): salvar_pdf_organizado(pdf_bytes, nome_arquivo, get_val(l,["Data de entrada"]))
+                        if st.button("☁️ SALVAR NO DRIVE COMPARTILHADO"): salvar_pdf_organizado(pdf_bytes, nome_arquivo, get_val(l,["Data de entrada"]), chave_pdf)
                 except Exception as e: st.error(f"Erro na geração: {e}")
             else: 
-                if numero_busca and df_filtrado.empty: st.warning("Nenhum resultado.")
+                if filtrando and df_filtrado.empty: st.warning("Nenhum resultado.")
 
     elif menu=="Solução":
         df=carregar_excel_drive("Solução Preservativa")
@@ -508,7 +733,9 @@ def main():
                     "Data de Registro": st.column_config.DateColumn("Data de Registro", format="DD/MM/YYYY"),
             }
 
-            st.data_editor(df[cols_finais], use_container_width=True, column_config=column_config_dates)
+            st.data_editor(sem_categorias(df[cols_finais]), use_container_width=True, column_config=column_config_dates)
+
+    if st.session_state['user'] in ["admin", "Lpm"]: painel_desempenho()
 
 if __name__ == "__main__":
     main()
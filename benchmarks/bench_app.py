@@ -0,0 +1,137 @@
+"""Benchmark das etapas do app.py com planilhas sintéticas e um Drive falso em memória (sem rede).
+
+Mede separadamente carregar_excel_drive (frio e a partir do snapshot local),
+aplicar_formulas, salvar_excel_drive (que já inclui as fórmulas), gerar_pdf (e pdf_relatorio, com cache),
+salvar_pdf_organizado e salvar_pdfs_lote (inclusive reenviando PDFs iguais), e conta
+as idas e voltas ao Drive de cada etapa.
+
+    python benchmarks/bench_app.py                        # 1k, 10k e 100k linhas
+    python benchmarks/bench_app.py --tamanhos 1000 --json resultado.json
+    python benchmarks/bench_app.py --latencia-ms 80       # simula a rede até o Drive
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("PASTA_SNAPSHOTS", tempfile.mkdtemp(prefix="ufv-bench-snap-"))
+os.environ.setdefault("ARQUIVO_METRICAS", "")
+warnings.filterwarnings("ignore")
+logging.disable(logging.WARNING)  # o streamlit reclama de rodar fora do "streamlit run"
+
+import streamlit as st
+import app
+from calculos import aplicar_formulas
+from drive import ID_ARQUIVO_EXCEL, ID_PASTA_RAIZ, cache_pastas
+from relatorio_pdf import chave_relatorio, gerar_pdf, pdf_relatorio
+from benchmarks.dados_sinteticos import gerar_workbook
+from benchmarks.drive_falso import DriveFalso, PASTA
+
+ABA = "Madeira Tratada"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def workbook(n, pasta_cache):
+    """Gera (ou reaproveita do disco) a planilha sintética de n linhas."""
+    caminho = os.path.join(pasta_cache, f"madeira_{n}.xlsx")
+    if not os.path.exists(caminho):
+        os.makedirs(pasta_cache, exist_ok=True)
+        with open(caminho + ".tmp", "wb") as f: f.write(gerar_workbook(n, app.COLS_PADRAO_MADEIRA, app.COLS_PADRAO_SOLUCAO))
+        os.replace(caminho + ".tmp", caminho)
+    with open(caminho, "rb") as f: return f.read()
+
+
+def preparar_drive(conteudo, latencia):
+    drive = DriveFalso(latencia=latencia)
+    drive.criar({"name": "Planilha.xlsx", "mimeType": XLSX}, conteudo, file_id=ID_ARQUIVO_EXCEL)
+    drive.criar({"name": "Relatórios", "mimeType": PASTA}, file_id=ID_PASTA_RAIZ)
+    app.get_drive_service = lambda: drive
+    return drive
+
+
+def limpar_caches(snapshots=True):
+    st.cache_data.clear(); st.cache_resource.clear(); cache_pastas().clear()
+    if snapshots: app.descartar_snapshot(ABA)
+
+
+def medir(drive, fn, repeticoes=1, antes=None):
+    """Tempo médio por repetição (s) e chamadas ao Drive feitas durante a medição."""
+    total = 0.0; drive.chamadas.clear(); resultado = None
+    for _ in range(repeticoes):
+        if antes: antes()
+        inicio = time.perf_counter(); resultado = fn(); total += time.perf_counter() - inicio
+    return total / repeticoes, dict(drive.chamadas), resultado
+
+
+def rodar(n, args):
+    drive = preparar_drive(workbook(n, args.cache), args.latencia_ms / 1000)
+    etapas = {}
+
+    t, chamadas, df = medir(drive, lambda: app.carregar_excel_drive(ABA), antes=limpar_caches)
+    etapas["carregar_excel_drive (frio)"] = (t, chamadas)
+    t, chamadas, _ = medir(drive, lambda: app.carregar_excel_drive(ABA), antes=lambda: limpar_caches(snapshots=False))
+    etapas["carregar_excel_drive (snapshot)"] = (t, chamadas)
+    time.sleep(0.2)  # deixa a verificação de revisão em segundo plano terminar
+
+    t, chamadas, (calculado, _) = medir(drive, lambda: aplicar_formulas(df.copy()), repeticoes=3)
+    etapas["aplicar_formulas"] = (t, chamadas)
+
+    carregadas = df.head(min(args.editadas, len(df)))
+    editadas = carregadas.copy()
+    editadas["Cromo (%)"] = 2.5
+    t, chamadas, _ = medir(drive, lambda: app.salvar_excel_drive(editadas.copy(), ABA, carregadas))
+    etapas[f"salvar_excel_drive ({len(editadas)} linhas)"] = (t, chamadas)
+
+    linhas = calculado.head(args.pdfs).to_dict("records")
+    gerar_pdf(linhas[0])  # aquece o modelo do relatório (medido à parte no bench_pdf.py)
+    t, chamadas, _ = medir(drive, lambda: [gerar_pdf(l) for l in linhas])
+    etapas["gerar_pdf (por relatório)"] = (t / len(linhas), chamadas)
+    [pdf_relatorio(l) for l in linhas]
+    t, chamadas, _ = medir(drive, lambda: [pdf_relatorio(l) for l in linhas])
+    etapas["pdf_relatorio (do cache, por relatório)"] = (t / len(linhas), chamadas)
+
+    pdf = gerar_pdf(linhas[0])
+    cache_pastas().clear()
+    t, chamadas, _ = medir(drive, lambda: app.salvar_pdf_organizado(pdf, "bench.pdf", linhas[0].get("Data de entrada")))
+    etapas["salvar_pdf_organizado (pastas frias)"] = (t, chamadas)
+    t, chamadas, _ = medir(drive, lambda: app.salvar_pdf_organizado(pdf, "bench.pdf", linhas[0].get("Data de entrada")), repeticoes=5)
+    etapas["salvar_pdf_organizado (pastas em cache)"] = (t, chamadas)
+
+    arquivos = [(pdf, f"{l.get('Código UFV')}.pdf", l.get("Data de entrada"), chave_relatorio(l)) for l in linhas]
+    t, chamadas, _ = medir(drive, lambda: app.salvar_pdfs_lote(arquivos))
+    etapas[f"salvar_pdfs_lote ({len(arquivos)} PDFs)"] = (t, chamadas)
+    t, chamadas, _ = medir(drive, lambda: app.salvar_pdfs_lote(arquivos))
+    etapas[f"salvar_pdfs_lote (repetido, {len(arquivos)} iguais)"] = (t, chamadas)
+    return etapas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000], help="linhas da aba Madeira Tratada")
+    parser.add_argument("--editadas", type=int, default=50, help="linhas alteradas no salvar_excel_drive")
+    parser.add_argument("--pdfs", type=int, default=20, help="relatórios no gerar_pdf / salvar_pdfs_lote")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="latência simulada por ida e volta ao Drive")
+    parser.add_argument("--cache", default=os.path.join(tempfile.gettempdir(), "ufv-bench"), help="pasta das planilhas sintéticas geradas")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    resultados = {}
+    for n in args.tamanhos:
+        print(f"\n== {n} linhas ==", flush=True)
+        etapas = rodar(n, args)
+        for nome, (t, chamadas) in etapas.items():
+            resumo = ", ".join(f"{k}={v}" for k, v in sorted(chamadas.items())) or "-"
+            print(f"{nome:<42} {t*1000:10.1f} ms   Drive: {resumo}", flush=True)
+        resultados[n] = {nome: {"segundos": t, "chamadas_drive": chamadas} for nome, (t, chamadas) in etapas.items()}
+    if args.json:
+        with open(args.json, "w") as f: json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Micro-benchmark do gerar_pdf: relatórios por segundo com o modelo preparado uma vez
+por processo ("depois") e refazendo o modelo a cada relatório, como era antes ("antes").
+
+    python benchmarks/bench_pdf.py [-n 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)  # os logos são procurados no diretório atual
+
+import relatorio_pdf
+
+AMOSTRA = {
+    "Código UFV": "UFV-M-620", "Data de entrada": date(2024, 3, 12), "Data de Registro": date(2024, 3, 20),
+    "Nome do Cliente": "Cliente Exemplo Ltda", "Cidade": "Viçosa", "Estado": "MG", "E-mail": "lab@exemplo.com",
+    "Madeira": "Eucalipto", "Produto": "CCA-C", "Aplicação": "Postes", "Norma": "NBR 16143", "Retenção": 4.0,
+    "Retenção Cromo (Kg/m³)": 2.41, "Retenção Cobre (Kg/m³)": 0.93, "Retenção Arsênio (Kg/m³)": 1.72,
+    "Balanço Cromo %": 47.6, "Balanço Cobre %": 18.4, "Balanço Arsênio %": 34.0,
+    "Grau": 1, "Descrição Grau": "Profunda e regular", "Descrição Penetração": "Indica a penetração profunda e uniforme em toda a extensão do alburno.",
+    "Observação": "Os resultados da análise química apresentaram uma retenção do produto de acordo com o padrão mínimo exigido pela norma ABNT NBR 16143",
+}
+
+def medir(n, frio):
+    inicio = time.perf_counter()
+    for _ in range(n):
+        if frio: relatorio_pdf.modelo.cache_clear(); relatorio_pdf.rotulo.cache_clear()
+        relatorio_pdf.gerar_pdf(AMOSTRA)
+    return n / (time.perf_counter() - inicio)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=20, help="relatórios por medição")
+    args = parser.parse_args()
+    antes = medir(max(1, args.n // 10), frio=True)
+    relatorio_pdf.gerar_pdf(AMOSTRA)  # aquece o modelo
+    depois = medir(args.n, frio=False)
+    print(f"antes  (modelo refeito a cada relatório): {antes:8.1f} relatórios/s")
+    print(f"depois (modelo preparado uma vez):        {depois:8.1f} relatórios/s  ({depois/antes:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Confere que a leitura pelo XML (planilha.ler_colunas_xml) dá o mesmo DataFrame que o pd.read_excel
+(planilha.ler_colunas_read_excel), antes e depois do normalizar_tipos. Rodar ao atualizar o openpyxl ou o pandas:
+a leitura pelo XML usa internos do openpyxl.
+
+    python benchmarks/conferir_leitura.py                  # planilha com casos de borda + sintéticas de 1k e 10k linhas
+    python benchmarks/conferir_leitura.py --tamanhos 1000
+
+Sai com código 1 se alguma aba ler diferente.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import warnings
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+warnings.filterwarnings("ignore")
+logging.disable(logging.WARNING)  # o streamlit reclama de rodar fora do "streamlit run"
+
+import openpyxl
+import pandas as pd
+
+import planilha
+from app import COLS_PADRAO_MADEIRA, COLS_PADRAO_SOLUCAO
+from benchmarks.dados_sinteticos import gerar_workbook
+
+
+def workbook_bordas():
+    """Cabeçalho com espaços, vazio e repetido, texto numérico com vírgula, textos nulos e erros, linhas vazias no meio e no fim,
+    linha só com coluna proibida, célula fora do cabeçalho, datas e booleanos."""
+    wb = openpyxl.Workbook(); ws = wb.active; ws.title = "Madeira Tratada"
+    ws.append(["Código UFV", " Grau ", None, "Cromo (%)", "Temperatura", "Obs", "Obs", "Data de entrada", "Flag"])
+    ws.append(["123", 3, "x", "1,5", 20, "NA", "a", datetime(2024, 1, 2), True])
+    ws.append([None] * 9)
+    ws.append(["124", 2.0, None, 1.25, None, "#DIV/0!", None, None, False])
+    ws.append([None, None, None, None, 22])
+    ws.append(["125", "3", None, 2, None, None, "b", datetime(2024, 1, 5), None])
+    ws.cell(row=8, column=12, value="longe")
+    ws.append([])
+    buf = io.BytesIO(); wb.save(buf)
+    return buf.getvalue()
+
+
+def conferir(conteudo, aba, rotulo):
+    descartar = planilha.COLS_PROIBIDAS.get(aba, ())
+    esperado = planilha.ler_colunas_read_excel(conteudo, aba, descartar)
+    lido = planilha.ler_colunas_xml(conteudo, aba, descartar)
+    try:
+        pd.testing.assert_frame_equal(esperado, lido, check_dtype=False)
+        pd.testing.assert_frame_equal(planilha.normalizar_tipos(esperado), planilha.normalizar_tipos(lido))
+    except AssertionError as e:
+        print(f"{rotulo}: DIFERENTE\n{e}", flush=True)
+        return False
+    print(f"{rotulo}: ok {lido.shape}", flush=True)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000], help="linhas das planilhas sintéticas")
+    args = parser.parse_args()
+
+    print(f"openpyxl {openpyxl.__version__}, pandas {pd.__version__}", flush=True)
+    ok = conferir(workbook_bordas(), "Madeira Tratada", "casos de borda")
+    for n in args.tamanhos:
+        conteudo = gerar_workbook(n, COLS_PADRAO_MADEIRA, COLS_PADRAO_SOLUCAO)
+        for aba in ("Madeira Tratada", "Solução Preservativa"): ok = conferir(conteudo, aba, f"{n} linhas, {aba}") and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
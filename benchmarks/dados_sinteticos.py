@@ -0,0 +1,85 @@
+"""Planilhas sintéticas no formato da planilha do laboratório ("Madeira Tratada" e
+"Solução Preservativa"), com os nomes de coluna reais do app.py.
+
+Os dados imitam a planilha de verdade: parte dos números vem como texto com vírgula
+decimal, há células vazias e as colunas proibidas também existem (o carregamento
+precisa descartá-las). Mesma semente, mesma planilha.
+"""
+import io
+import random
+from datetime import date, timedelta
+
+import openpyxl
+
+CLIENTES = ["Montana Química", "Eucatex", "Gerdau Florestal", "Tratamadeiras Vale", "Postes Minas", "Madeireira Viçosa", "Cooperativa Rural Sul"]
+APLICACOES = ["Postes", "Mourões", "Dormentes", "Cruzetas", "Estacas", "Madeira Serrada", "Outros"]
+MADEIRAS = ["Eucalipto", "Pinus", "Eucalipto citriodora"]
+PRODUTOS = ["CCA-C", "CCB", "Osmose K33"]
+CIDADES = [("Viçosa", "MG"), ("Belo Horizonte", "MG"), ("Curitiba", "PR"), ("Campinas", "SP")]
+
+# Colunas que o app lê/calcula além das padrões, na ordem em que aparecem na planilha
+EXTRAS_MADEIRA = ["Data de Registro", "Início da análise", "Fim da análise", "Cidade", "Estado", "E-mail", "Indentificação de Amostra",
+                  "Madeira", "Produto", "Norma", "Diâmetro médio (cm)", "Comprim. Médio (cm)", "Massa média (g)", "Densidade (g/cm³)",
+                  "Soma Concentração", "Balanço Cromo %", "Balanço Cobre %", "Balanço Arsênio %", "Balanço Total",
+                  "Retenção Cromo (Kg/m³)", "Retenção Cobre (Kg/m³)", "Retenção Arsênio (Kg/m³)", "Retenção", "Retenção Esp.",
+                  # proibidas na aba Madeira (o carregamento descarta)
+                  "pH da solução", "Densidade  solução (g/cm³)", "Temperatura", "Concentração pela tabela"]
+EXTRAS_SOLUCAO = ["pH da solução", "Temperatura", "Diâmetro 1 (mm)", "Massa 1 (g)", "Retenção", "Retenção Esp."]
+
+
+def numero(rnd, a, b, casas=1, vazio=0.03, virgula=0.3):
+    """Número aleatório como a planilha traz: às vezes vazio, às vezes texto com vírgula."""
+    if rnd.random() < vazio: return None
+    v = round(rnd.uniform(a, b), casas)
+    return f"{v}".replace(".", ",") if rnd.random() < virgula else v
+
+
+def linha_madeira(rnd, i, inicio):
+    entrada = inicio + timedelta(days=i // 15)
+    cidade, uf = rnd.choice(CIDADES)
+    d = {
+        "Código UFV": f"UFV-M-{i + 1}", "Data de entrada": entrada, "Nome do Cliente": rnd.choice(CLIENTES), "Aplicação": rnd.choice(APLICACOES),
+        "Grau": rnd.choice([1, 2, 3, 4, 5, None]), "Descrição Grau": None, "Descrição Penetração": None,
+        "Diâmetro 1 (mm)": numero(rnd, 8, 30), "Diâmetro 2 (mm)": numero(rnd, 8, 30),
+        "Comprim. 1 (mm)": numero(rnd, 20, 60), "Comprim. 2 (mm)": numero(rnd, 20, 60),
+        "Massa 1 (g)": numero(rnd, 1, 12, 2), "Massa 2 (g)": numero(rnd, 1, 12, 2),
+        "Volume (cm³)": None, "Densidade (Kg/m³)": None,
+        "Cromo (%)": numero(rnd, 0.5, 3, 2), "Cobre (%)": numero(rnd, 0.2, 1.5, 2), "Arsênio (%)": numero(rnd, 0.3, 2.5, 2),
+        "Retenção Total (Kg/m³)": None, "Observação": None,
+        "Data de Registro": entrada + timedelta(days=7), "Início da análise": entrada + timedelta(days=1), "Fim da análise": entrada + timedelta(days=6),
+        "Cidade": cidade, "Estado": uf, "E-mail": f"contato{i % 50}@cliente.com.br", "Indentificação de Amostra": f"Lote {i // 20 + 1} / peça {i % 20 + 1}",
+        "Madeira": rnd.choice(MADEIRAS), "Produto": rnd.choice(PRODUTOS), "Norma": "NBR 16143",
+        "pH da solução": numero(rnd, 1.5, 2.5), "Densidade  solução (g/cm³)": numero(rnd, 1.0, 1.1, 3), "Temperatura": numero(rnd, 18, 30), "Concentração pela tabela": numero(rnd, 1, 3),
+    }
+    return d
+
+
+def linha_solucao(rnd, i, inicio):
+    cr, cu, ars = round(rnd.uniform(45, 50), 2), round(rnd.uniform(17, 20), 2), round(rnd.uniform(32, 36), 2)
+    return {
+        "Código UFV": f"UFV-S-{i + 1}", "Data de entrada": inicio + timedelta(days=i // 5), "Nome do Cliente": rnd.choice(CLIENTES),
+        "Cromo (%)": cr, "Cobre (%)": cu, "Arsênio (%)": ars, "Soma Concentração": round(cr + cu + ars, 2), "Balanço Total": 100.0,
+        "Grau do aspecto": rnd.choice([1, 2, 3]), "Descrição do aspecto": rnd.choice(["Límpida", "Turva", "Com precipitado"]),
+        "pH da solução": numero(rnd, 1.5, 2.5), "Temperatura": numero(rnd, 18, 30), "Diâmetro 1 (mm)": None, "Massa 1 (g)": None, "Retenção": None, "Retenção Esp.": None,
+    }
+
+
+def gerar_workbook(n_linhas, cols_madeira, cols_solucao, semente=42, linhas_solucao=None):
+    """Bytes de um xlsx com as duas abas. `cols_*` são as colunas padrão do app (COLS_PADRAO_*)."""
+    rnd = random.Random(semente)
+    inicio = date(2020, 1, 6)
+    madeira = [c for c in cols_madeira if c != "Selecionar"] + [c for c in EXTRAS_MADEIRA if c not in cols_madeira]
+    solucao = list(cols_solucao) + [c for c in EXTRAS_SOLUCAO if c not in cols_solucao]
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Madeira Tratada")
+    ws.append(madeira)
+    for i in range(n_linhas):
+        d = linha_madeira(rnd, i, inicio)
+        ws.append([d.get(c) for c in madeira])
+    ws = wb.create_sheet("Solução Preservativa")
+    ws.append(solucao)
+    for i in range(linhas_solucao if linhas_solucao is not None else max(1, n_linhas // 10)):
+        d = linha_solucao(rnd, i, inicio)
+        ws.append([d.get(c) for c in solucao])
+    buf = io.BytesIO(); wb.save(buf)
+    return buf.getvalue()
@@ -0,0 +1,125 @@
+"""Substituto em memória da API files() do Google Drive v3, para rodar o app sem rede.
+
+Cobre só o que o app.py usa: files().get / get_media / list / create / update e
+new_batch_http_request. Cada arquivo guarda conteúdo, md5, revisão e appProperties.
+Conta as chamadas por método e pode simular a latência de cada ida e volta.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+
+PASTA = "application/vnd.google-apps.folder"
+
+
+class Requisicao:
+    def __init__(self, drive, metodo, fn):
+        self.drive, self.metodo, self.fn = drive, metodo, fn
+
+    def execute(self, http=None, num_retries=0):
+        self.drive.ida_e_volta(self.metodo)
+        return self.fn()
+
+
+class Lote:
+    def __init__(self, drive, callback):
+        self.drive, self.callback, self.itens = drive, callback, []
+
+    def add(self, requisicao, callback=None, request_id=None):
+        self.itens.append((request_id or str(len(self.itens) + 1), requisicao, callback or self.callback))
+
+    def execute(self, http=None):
+        self.drive.ida_e_volta("batch")
+        for request_id, req, callback in self.itens:
+            try: resposta, erro = req.fn(), None
+            except Exception as e: resposta, erro = None, e
+            if callback: callback(request_id, resposta, erro)
+
+
+class ErroDrive(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class Arquivos:
+    def __init__(self, drive): self.drive = drive
+
+    def get(self, fileId, fields=None, **kwargs):
+        return Requisicao(self.drive, "get", lambda: self.drive.metadados(fileId))
+
+    def get_media(self, fileId, **kwargs):
+        return Requisicao(self.drive, "get_media", lambda: self.drive.arquivo(fileId)["conteudo"])
+
+    def list(self, q="", fields=None, **kwargs):
+        return Requisicao(self.drive, "list", lambda: {"files": [self.drive.metadados(i) for i in self.drive.buscar(q)]})
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        conteudo = ler_media(media_body)
+        return Requisicao(self.drive, "create", lambda: self.drive.metadados(self.drive.criar(body or {}, conteudo)))
+
+    def update(self, fileId, body=None, media_body=None, fields=None, **kwargs):
+        conteudo = ler_media(media_body)
+        return Requisicao(self.drive, "update", lambda: self.drive.metadados(self.drive.atualizar(fileId, body or {}, conteudo)))
+
+
+def ler_media(media_body):
+    if media_body is None: return None
+    return media_body.getbytes(0, media_body.size())
+
+
+class DriveFalso:
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.arquivos = {}
+        self.chamadas = Counter()
+        self._seq = 0
+
+    # --- interface usada pelo app (no lugar do service do googleapiclient) ---
+    def files(self): return Arquivos(self)
+    def new_batch_http_request(self, callback=None): return Lote(self, callback)
+
+    # --- estado ---
+    def ida_e_volta(self, metodo):
+        self.chamadas[metodo] += 1
+        if self.latencia: time.sleep(self.latencia)
+
+    def arquivo(self, file_id):
+        if file_id not in self.arquivos: raise ErroDrive(404, f"File not found: {file_id}")
+        return self.arquivos[file_id]
+
+    def metadados(self, file_id):
+        a = self.arquivo(file_id)
+        meta = {k: a[k] for k in ("id", "name", "mimeType", "parents", "appProperties", "headRevisionId", "modifiedTime") if k in a}
+        if a.get("conteudo") is not None: meta["md5Checksum"] = hashlib.md5(a["conteudo"]).hexdigest(); meta["size"] = str(len(a["conteudo"]))
+        return meta
+
+    def criar(self, body, conteudo=None, file_id=None):
+        self._seq += 1
+        file_id = file_id or f"falso-{self._seq}"
+        self.arquivos[file_id] = {"id": file_id, "name": body.get("name", ""), "mimeType": body.get("mimeType", ""), "parents": list(body.get("parents", [])),
+                                  "appProperties": dict(body.get("appProperties", {})), "conteudo": conteudo}
+        self._nova_revisao(file_id)
+        return file_id
+
+    def atualizar(self, file_id, body, conteudo=None):
+        a = self.arquivo(file_id)
+        if "name" in body: a["name"] = body["name"]
+        if "appProperties" in body: a["appProperties"].update(body["appProperties"])
+        if conteudo is not None: a["conteudo"] = conteudo
+        self._nova_revisao(file_id)
+        return file_id
+
+    def _nova_revisao(self, file_id):
+        self._seq += 1
+        self.arquivos[file_id]["headRevisionId"] = f"rev-{self._seq}"
+        self.arquivos[file_id]["modifiedTime"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+
+    def buscar(self, q):
+        """Interpreta o subconjunto da sintaxe de q que o app usa (name, mimeType, parents, appProperties, trashed)."""
+        filtros = []
+        for campo, valor in re.findall(r"(name|mimeType)\s*=\s*'((?:[^'\\]|\\.)*)'", q): filtros.append(lambda a, c=campo, v=valor.replace("\\'", "'"): a.get(c) == v)
+        for pai in re.findall(r"'([^']*)'\s+in\s+parents", q): filtros.append(lambda a, p=pai: p in a.get("parents", []))
+        for chave, valor in re.findall(r"appProperties\s+has\s+\{\s*key\s*=\s*'([^']*)'\s+and\s+value\s*=\s*'([^']*)'\s*\}", q):
+            filtros.append(lambda a, k=chave, v=valor: a.get("appProperties", {}).get(k) == v)
+        return [i for i, a in self.arquivos.items() if all(f(a) for f in filtros)]
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+# Fórmulas da planilha (o que o Excel calculava).
+
+# --- REGRAS ---
+REGRAS_RETENCAO = {
+    "Postes": 4.0, "Mourões": 6.5, "Dormentes": 6.5, "Cruzetas": 9.6, "Estacas": 6.5, "Madeira Serrada": 4.0
+}
+DESC_GRAU = {
+    1: ("Profunda e regular", "Indica a penetração profunda e uniforme em toda a extensão do alburno."),
+    2: ("Profunda e irregular", "Indica a penetração profunda, mas desuniforme em toda a extensão do alburno."),
+    3: ("Parcial e regular", "Indica a penetração uniforme, mas não total pela extensão do alburno."),
+    4: ("Parcial e irregular", "Indica a penetração desuniforme e não total pela extensão do alburno."),
+    5: ("Sem Reação do Cromoazurol", "Sem Reação do Cromoazurol")
+}
+TXT_APROVADO = "Os resultados da análise química apresentaram uma retenção do produto de acordo com o padrão mínimo exigido pela norma ABNT NBR 16143"
+TXT_REPROVADO = "Os resultados da análise química apresentaram uma retenção do produto inferior ao padrão mínimo exigido pela norma ABNT NBR 16143"
+# Colunas que o aplicar_formulas escreve (derivadas das entradas da mesma linha)
+COLS_CALCULADAS = ['Descrição Grau', 'Descrição Penetração', 'Diâmetro médio (cm)', 'Comprim. Médio (cm)', 'Massa média (g)', 'Volume (cm³)',
+                   'Densidade (g/cm³)', 'Densidade (Kg/m³)', 'Soma Concentração', 'Balanço Cromo %', 'Balanço Cobre %', 'Balanço Arsênio %',
+                   'Balanço Total', 'Retenção Cromo (Kg/m³)', 'Retenção Cobre (Kg/m³)', 'Retenção Arsênio (Kg/m³)', 'Retenção Total (Kg/m³)',
+                   'Retenção', 'Retenção Esp.', 'Observação']
+
+# --- MATEMÁTICA FORTE ---
+def to_float(v):
+    """Converte qualquer coisa para float na marra."""
+    try:
+        if pd.isna(v): return 0.0
+        s_val = str(v).strip().replace(",", ".")
+        if s_val == "": return 0.0
+        return float(s_val)
+    except: return 0.0
+
+def serie_float(df, col):
+    """Versão vetorizada do to_float para uma coluna inteira (coluna ausente vira zeros)."""
+    if col not in df.columns: return pd.Series(0.0, index=df.index)
+    s = df[col]
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(float).fillna(0.0)
+    s_str = s.astype(object).where(s.notna(), "").astype(str).str.strip().str.replace(",", ".", regex=False)
+    return pd.to_numeric(s_str, errors='coerce').fillna(0.0)
+
+def arred(valores, casas):
+    # round() do Python (e não np.round) para manter os mesmos resultados de antes em casos como 2.675
+    return np.fromiter((round(v, casas) for v in valores.tolist()), dtype=float, count=len(valores))
+
+def media_positivos(valores, colunas):
+    matriz = np.column_stack([valores[c] for c in colunas])
+    positivos = matriz > 0
+    qtd = positivos.sum(axis=1)
+    soma = np.where(positivos, matriz, 0.0).sum(axis=1)
+    return np.divide(soma, qtd, out=np.zeros(len(matriz)), where=qtd > 0)
+
+def gravar_coluna(df, mask, col, valores, casas=None):
+    """Equivale ao df.at[i, col] = valor para todas as linhas do mask, criando a coluna se preciso."""
+    if not mask.any(): return
+    if isinstance(valores, np.ndarray):
+        valores = valores[mask]
+        if casas is not None: valores = arred(valores, casas)
+    texto = isinstance(valores, str) or (isinstance(valores, np.ndarray) and valores.dtype == object)
+    if col in df.columns:
+        destino = df[col].dtype
+        if texto: compativel = pd.api.types.is_object_dtype(destino) or pd.api.types.is_string_dtype(destino)
+        else: compativel = pd.api.types.is_float_dtype(destino) or pd.api.types.is_object_dtype(destino)
+        if not compativel:
+            numerico = pd.api.types.is_numeric_dtype(destino) and not pd.api.types.is_bool_dtype(destino)
+            df[col] = df[col].astype(float if numerico and not texto else object)
+    df.loc[mask, col] = valores
+
+def aplicar_formulas(df, escritas=None):
+    """Calcula as colunas derivadas (grau, físico, química, aprovação) no próprio df. Retorna (df, erros).
+    Com `escritas` (dict), anota nele {coluna: máscara das linhas que as fórmulas gravaram}: várias COLS_CALCULADAS
+    (Observação, Densidade (Kg/m³)...) só são calculadas em algumas linhas e nas outras são digitadas."""
+    erros = []
+    if df.empty: return df, erros
+    cols = df.columns
+    n = len(df)
+
+    def gravar(mask, col, valores, casas=None):
+        gravar_coluna(df, mask, col, valores, casas)
+        if escritas is not None and mask.any(): escritas[col] = escritas[col] | mask if col in escritas else mask.copy()
+
+    # Entradas lidas uma única vez (antes de qualquer escrita, como o row do iterrows)
+    cols_num = [c for c in ['Grau', 'Densidade (Kg/m³)'] if c in cols]
+    if 'Cromo (%)' in cols: cols_num += ['Cromo (%)', 'Cobre (%)', 'Arsênio (%)']
+    if 'Diâmetro 1 (mm)' in cols:
+        cols_num += [f'{p} {x} ({u})' for p, u in [('Diâmetro', 'mm'), ('Comprim.', 'mm'), ('Massa', 'g')] for x in range(1, 6)]
+    valores = {c: serie_float(df, c).to_numpy() for c in cols_num}
+
+    # --- 0. MÁSCARA DE ERROS (substitui o try/except por linha) ---
+    invalidos = {c: ~np.isfinite(v) for c, v in valores.items()}
+    erro = np.zeros(n, dtype=bool)
+    for m in invalidos.values(): erro |= m
+    if erro.any():
+        codigos = df['Código UFV'].tolist() if 'Código UFV' in cols else [f'Linha {i}' for i in df.index]
+        for pos in np.flatnonzero(erro):
+            cols_ruins = ", ".join(c for c, m in invalidos.items() if m[pos])
+            erros.append(f"Erro em {codigos[pos]}: valor inválido em {cols_ruins}")
+    ok = ~erro
+
+    # --- 1. CÁLCULO DE GRAU (PRIORIDADE TOTAL) ---
+    if 'Grau' in cols:
+        grau = valores['Grau']
+        grau_int = np.trunc(np.where(ok, grau, 0))
+        for g, (d_curta, d_longa) in DESC_GRAU.items():
+            m = ok & (grau > 0) & (grau_int == g)
+            gravar(m, 'Descrição Grau', d_curta)
+            gravar(m, 'Descrição Penetração', d_longa)
+
+    # --- 2. CÁLCULO FÍSICO ---
+    dens_kg_m3 = np.zeros(n)
+    if 'Diâmetro 1 (mm)' in cols:
+        diam_medio_cm = media_positivos(valores, [f'Diâmetro {x} (mm)' for x in range(1, 6)]) / 10.0
+        comp_medio_cm = media_positivos(valores, [f'Comprim. {x} (mm)' for x in range(1, 6)]) / 10.0
+        massa_media = media_positivos(valores, [f'Massa {x} (g)' for x in range(1, 6)])
+        gravar(ok & (diam_medio_cm > 0), 'Diâmetro médio (cm)', diam_medio_cm, casas=2)
+        gravar(ok & (comp_medio_cm > 0), 'Comprim. Médio (cm)', comp_medio_cm, casas=2)
+        gravar(ok & (massa_media > 0), 'Massa média (g)', massa_media, casas=2)
+
+        tem_vol = ok & (diam_medio_cm > 0) & (comp_medio_cm > 0)
+        vol = np.where(tem_vol, 3.14159 * ((diam_medio_cm/2)**2) * comp_medio_cm, 0.0)
+        gravar(tem_vol, 'Volume (cm³)', vol, casas=2)
+
+        tem_dens = tem_vol & (vol > 0) & (massa_media > 0)
+        dens_g_cm3 = np.divide(massa_media, vol, out=np.zeros(n), where=tem_dens)
+        dens_kg_m3 = dens_g_cm3 * 1000
+        gravar(tem_dens, 'Densidade (g/cm³)', dens_g_cm3, casas=3)
+        gravar(tem_dens, 'Densidade (Kg/m³)', dens_kg_m3, casas=2)
+
+    # --- 3. QUÍMICA ---
+    if 'Cromo (%)' in cols:
+        cr_pct, cu_pct, as_pct = valores['Cromo (%)'], valores['Cobre (%)'], valores['Arsênio (%)']
+        soma_conc = cr_pct + cu_pct + as_pct
+        gravar(ok, 'Soma Concentração', soma_conc, casas=2)
+
+        tem_soma = ok & (soma_conc > 0)
+        soma_seg = np.where(tem_soma, soma_conc, 1.0)
+        gravar(tem_soma, 'Balanço Cromo %', (cr_pct/soma_seg)*100, casas=2)
+        gravar(tem_soma, 'Balanço Cobre %', (cu_pct/soma_seg)*100, casas=2)
+        gravar(tem_soma, 'Balanço Arsênio %', (as_pct/soma_seg)*100, casas=2)
+        gravar(tem_soma, 'Balanço Total', 100.00)
+
+        if 'Densidade (Kg/m³)' in cols:
+            dens_kg_m3 = np.where(dens_kg_m3 == 0, valores['Densidade (Kg/m³)'], dens_kg_m3)
+
+        tem_ret = ok & (dens_kg_m3 > 0)
+        ret_cr = (cr_pct/100)*dens_kg_m3
+        ret_cu = (cu_pct/100)*dens_kg_m3
+        ret_as = (as_pct/100)*dens_kg_m3
+        gravar(tem_ret, 'Retenção Cromo (Kg/m³)', ret_cr, casas=2)
+        gravar(tem_ret, 'Retenção Cobre (Kg/m³)', ret_cu, casas=2)
+        gravar(tem_ret, 'Retenção Arsênio (Kg/m³)', ret_as, casas=2)
+
+        ret_total = ret_cr + ret_cu + ret_as
+        gravar(tem_ret, 'Retenção Total (Kg/m³)', ret_total, casas=2)
+
+        # 4. APROVAÇÃO (primeira regra que aparece no texto da aplicação, na ordem do dicionário)
+        aplicacao = df['Aplicação'].astype(str).str.strip().str.lower() if 'Aplicação' in cols else pd.Series("", index=df.index)
+        condicoes = [aplicacao.str.contains(k.lower(), regex=False).to_numpy() for k in REGRAS_RETENCAO]
+        ret_esp = np.select(condicoes, list(REGRAS_RETENCAO.values()), default=0.0)
+
+        tem_regra = tem_ret & (ret_esp > 0)
+        gravar(tem_regra, 'Retenção', ret_esp)
+        gravar(tem_regra, 'Retenção Esp.', ret_esp)
+        gravar(tem_regra, 'Observação', np.where(ret_total >= ret_esp, TXT_APROVADO, TXT_REPROVADO).astype(object))
+
+    return df, erros
@@ -0,0 +1,221 @@
+import hashlib
+import io
+import os
+import queue
+import httplib2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date
+from functools import lru_cache
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, HttpRequest
+from oauth2client.service_account import ServiceAccountCredentials
+from medicao import Medicao, contar_requisicao_drive
+
+# Acesso ao Google Drive (planilha e pastas dos relatórios).
+
+# ✅ IDs CONFIGURADOS
+ID_ARQUIVO_EXCEL = "1L0qTK6oy2axnCSlLadoyk9q5fExSnA6v"
+ID_PASTA_RAIZ = "1nZtJjVZUVx65GtjnmpTn5Hw_eZOXwpIY"
+
+# ✅ CONEXÃO COM O DRIVE
+DRIVE_TIMEOUT = int(os.environ.get("DRIVE_TIMEOUT", 60))  # segundos por requisição HTTP
+DRIVE_TENTATIVAS = int(os.environ.get("DRIVE_TENTATIVAS", 5))  # novas tentativas em 429/5xx (backoff exponencial com jitter)
+DRIVE_UPLOADS_PARALELOS = int(os.environ.get("DRIVE_UPLOADS_PARALELOS", 8))  # envios simultâneos no salvamento em lote
+DRIVE_LOTE_MAX = 100  # requisições por lote (limite da API do Drive)
+PROP_HASH_PDF = "hash_relatorio"  # appProperties dos PDFs no Drive: chave_relatorio do conteúdo enviado
+MESES = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
+
+# --- DRIVE ---
+class PoolConexoes:
+    """Conexões httplib2 autenticadas e reaproveitadas (keep-alive). httplib2 não é thread-safe, então cada requisição pega uma só para ela."""
+    def __init__(self, creds):
+        self.creds = creds; self.livres = queue.LifoQueue()
+    def pegar(self):
+        try: return self.livres.get_nowait()
+        except queue.Empty: return self.creds.authorize(httplib2.Http(timeout=DRIVE_TIMEOUT))
+    def devolver(self, conexao): self.livres.put(conexao)
+
+class RequisicaoDrive(HttpRequest):
+    """HttpRequest que executa numa conexão do pool e com retry/backoff por padrão (429, 5xx, erros de rede)."""
+    pool = None
+    def execute(self, http=None, num_retries=None):
+        if num_retries is None: num_retries = DRIVE_TENTATIVAS
+        contar_requisicao_drive()
+        if http is not None or self.pool is None: return super().execute(http=http, num_retries=num_retries)
+        conexao = self.pool.pegar()
+        try: return super().execute(http=conexao, num_retries=num_retries)
+        finally: self.pool.devolver(conexao)
+
+def conectar(credenciais):
+    """Cliente do Drive (v3) a partir do dict da conta de serviço: conexões do pool e retry/backoff em toda requisição."""
+    scope = ["https://www.googleapis.com/auth/drive"]
+    pool = PoolConexoes(ServiceAccountCredentials.from_json_keyfile_dict(credenciais, scope))
+    def construir_requisicao(*args, **kwargs):
+        req = RequisicaoDrive(*args, **kwargs); req.pool = pool; return req
+    service = build('drive', 'v3', http=pool.pegar(), requestBuilder=construir_requisicao, cache_discovery=False)
+    service.pool_conexoes = pool  # o executar_lote pega a conexão daqui
+    return service
+
+def executar_lote(service, lote):
+    """Executa um BatchHttpRequest numa conexão do pool (uma ida e volta HTTP para o lote todo)."""
+    pool = getattr(service, 'pool_conexoes', None); contar_requisicao_drive()
+    if pool is None: return lote.execute()
+    conexao = pool.pegar()
+    try: lote.execute(http=conexao)
+    finally: pool.devolver(conexao)
+
+def query_pasta(folder_name, parent_id):
+    return f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}' and '{parent_id}' in parents and trashed=false"
+
+def get_or_create_folder(service, folder_name, parent_id):
+    try:
+        query = query_pasta(folder_name, parent_id)
+        results = service.files().list(q=query, fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
+        items = results.get('files', [])
+        if items: return items[0]['id']
+        else:
+            metadata = {'name': folder_name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]}
+            return service.files().create(body=metadata, fields='id', supportsAllDrives=True).execute().get('id')
+    except: return None
+
+@lru_cache(maxsize=1)
+def cache_pastas():
+    """(id da pasta pai, nome) -> id da pasta. Vale para o processo todo."""
+    return {}
+
+def resolver_pastas(service, pares):
+    """Garante o id de cada pasta (pai, nome). As que não estão no cache são consultadas num único lote."""
+    pastas = cache_pastas()
+    faltando = sorted({p for p in pares if p not in pastas})
+    inexistentes = set()
+    if len(faltando) > 1:
+        def guardar(request_id, resposta, erro):
+            if erro is not None: return
+            par = faltando[int(request_id)]
+            if resposta.get('files'): pastas[par] = resposta['files'][0]['id']
+            else: inexistentes.add(par)
+        lote = service.new_batch_http_request(callback=guardar)
+        for i, (pai, nome) in enumerate(faltando):
+            lote.add(service.files().list(q=query_pasta(nome, pai), fields="files(id, name)", supportsAllDrives=True, includeItemsFromAllDrives=True), request_id=str(i))
+        try: executar_lote(service, lote)
+        except Exception: pass  # as que ficarem sem resposta caem na consulta individual abaixo
+    for pai, nome in faltando:
+        if (pai, nome) in pastas: continue
+        if (pai, nome) in inexistentes:
+            metadata = {'name': nome, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [pai]}
+            try: pasta_id = service.files().create(body=metadata, fields='id', supportsAllDrives=True).execute().get('id')
+            except Exception: pasta_id = None
+        else: pasta_id = get_or_create_folder(service, nome, pai)
+        if pasta_id: pastas[(pai, nome)] = pasta_id
+    return pastas
+
+def data_da_pasta(data_entrada_raw):
+    data_obj = datetime.now()
+    if isinstance(data_entrada_raw, (datetime, date)): 
+        data_obj = data_entrada_raw
+    elif data_entrada_raw and str(data_entrada_raw).strip() not in ["", "NaT", "None", "nan"]:
+        try:
+            v_str = str(data_entrada_raw).strip().split(" ")[0]
+            for fmt in ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d"]:
+                try: data_obj = datetime.strptime(v_str, fmt); break
+                except: continue
+        except: pass
+    return data_obj
+
+def pastas_destino(service, datas):
+    """Resolve as pastas ano/mês de várias datas. Retorna {(ano, mês): id da pasta do mês}."""
+    chaves = {(str(d.year), MESES[d.month]) for d in datas}
+    anos = resolver_pastas(service, [(ID_PASTA_RAIZ, ano) for ano, _ in chaves])
+    pares = {(ano, mes): (anos[(ID_PASTA_RAIZ, ano)], mes) for ano, mes in chaves if (ID_PASTA_RAIZ, ano) in anos}
+    meses = resolver_pastas(service, pares.values())
+    return {chave: meses[par] for chave, par in pares.items() if par in meses}
+
+def limpar_nome(nome_arquivo): return nome_arquivo.replace("/", "-").replace("\\", "-")
+
+def query_pdf(nome, parent_id):
+    nome = nome.replace("\\", "\\\\").replace("'", "\\'")
+    return f"name='{nome}' and '{parent_id}' in parents and trashed=false"
+
+def pdfs_existentes(service, pares):
+    """Arquivos já no Drive para cada (pasta do mês, nome), consultados em lotes.
+    Retorna {(pasta, nome): [{'id', 'appProperties'}]}; os pares sem resposta ficam de fora (o envio consulta sozinho)."""
+    pares = sorted(set(pares)); achados = {}
+    for inicio in range(0, len(pares), DRIVE_LOTE_MAX):
+        bloco = pares[inicio:inicio + DRIVE_LOTE_MAX]
+        def guardar(request_id, resposta, erro, bloco=bloco):
+            if erro is None: achados[bloco[int(request_id)]] = resposta.get('files', [])
+        lote = service.new_batch_http_request(callback=guardar)
+        for i, (pasta, nome) in enumerate(bloco):
+            lote.add(service.files().list(q=query_pdf(nome, pasta), fields="files(id, appProperties)", supportsAllDrives=True, includeItemsFromAllDrives=True), request_id=str(i))
+        try: executar_lote(service, lote)
+        except Exception: pass
+    return achados
+
+def enviar_pdf(service, pdf_bytes, nome_arquivo, data_obj, chave=None, existentes=None):
+    """Envia um PDF para a pasta ano/mês sem duplicar: se lá já há um arquivo com o mesmo nome e a mesma chave (appProperties), não envia;
+    com outra chave, atualiza esse arquivo no lugar. Retorna (id, 'novo' | 'atualizado' | 'igual').
+    `existentes` é a resposta já consultada em lote (pdfs_existentes). Se a pasta do cache sumiu do Drive, resolve de novo e tenta mais uma vez."""
+    chave_pasta = (str(data_obj.year), MESES[data_obj.month])
+    nome_limpo = limpar_nome(nome_arquivo)
+    chave = chave or hashlib.sha256(pdf_bytes).hexdigest()
+    for tentativa in range(2):
+        mes_id = pastas_destino(service, [data_obj]).get(chave_pasta)
+        if not mes_id: raise RuntimeError(f"Erro pasta {chave_pasta[0]}/{chave_pasta[1]}")
+        try:
+            if existentes is None or tentativa:
+                existentes = service.files().list(q=query_pdf(nome_limpo, mes_id), fields="files(id, appProperties)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute().get('files', [])
+            igual = next((f['id'] for f in existentes if (f.get('appProperties') or {}).get(PROP_HASH_PDF) == chave), None)
+            if igual: return igual, "igual"
+            media = MediaIoBaseUpload(io.BytesIO(pdf_bytes), mimetype='application/pdf', resumable=False)
+            if existentes:
+                arquivo = service.files().update(fileId=existentes[0]['id'], body={'appProperties': {PROP_HASH_PDF: chave}}, media_body=media, fields='id', supportsAllDrives=True).execute()
+                return arquivo.get('id'), "atualizado"
+            metadata = {'name': nome_limpo, 'parents': [mes_id], 'appProperties': {PROP_HASH_PDF: chave}}
+            return service.files().create(body=metadata, media_body=media, fields='id', supportsAllDrives=True).execute().get('id'), "novo"
+        except HttpError as e:
+            if e.resp.status != 404 or tentativa: raise
+            cache_pastas().clear()
+
+def enviar_pdfs(service, arquivos, ao_progredir=None):
+    """Envia vários PDFs [(bytes, nome, data de entrada, chave_relatorio)] para as pastas ano/mês, sem duplicar (ver enviar_pdf).
+    As pastas e os arquivos já existentes são consultados de uma vez (em lote) e os envios correm em paralelo no pool de conexões.
+    Retorna [{'nome', 'ok', 'pasta', 'id', 'situacao', 'erro'}] na ordem de entrada."""
+    datas = [data_da_pasta(d) for _, _, d, _ in arquivos]
+    resultados = [None] * len(arquivos)
+    with Medicao("salvar_pdfs_lote", arquivos=len(arquivos), bytes=sum(len(b) for b, _, _, _ in arquivos)) as m:
+        with m.etapa("pastas"): meses = pastas_destino(service, datas)
+        with m.etapa("existentes"):
+            alvos = [(meses.get((str(d.year), MESES[d.month])), limpar_nome(nome)) for d, (_, nome, _, _) in zip(datas, arquivos)]
+            existentes = pdfs_existentes(service, [a for a in alvos if a[0]])
+        def enviar(i):
+            pdf_bytes, nome, _, chave = arquivos[i]; d = datas[i]
+            pasta = f"{d.year}/{MESES[d.month]}"
+            try:
+                with m.nesta_thread(): arquivo_id, situacao = enviar_pdf(service, pdf_bytes, nome, d, chave, existentes.get(alvos[i]))
+                return {'nome': nome, 'ok': True, 'pasta': pasta, 'id': arquivo_id, 'situacao': situacao, 'erro': None}
+            except Exception as e: return {'nome': nome, 'ok': False, 'pasta': pasta, 'id': None, 'situacao': None, 'erro': str(e)}
+        with m.etapa("uploads"), ThreadPoolExecutor(max_workers=max(1, min(DRIVE_UPLOADS_PARALELOS, len(arquivos)))) as pool:
+            futuros = {pool.submit(enviar, i): i for i in range(len(arquivos))}
+            for feitos, fut in enumerate(as_completed(futuros), 1):
+                resultados[futuros[fut]] = fut.result()
+                if ao_progredir: ao_progredir(feitos, len(arquivos))
+        m.dados['falhas'] = sum(not r['ok'] for r in resultados)
+        m.dados['iguais'] = sum(r['situacao'] == "igual" for r in resultados)
+    return resultados
+
+# --- PLANILHA NO DRIVE ---
+class PlanilhaDrive:
+    """A planilha no Drive como origem do gravar_com_mescla (planilha.py): revisão (só metadados), download e envio."""
+    def __init__(self, service, file_id=ID_ARQUIVO_EXCEL):
+        self.service, self.file_id, self.baixado = service, file_id, (None, None)
+    def revisao(self):
+        meta = self.service.files().get(fileId=self.file_id, fields="md5Checksum, headRevisionId, modifiedTime", supportsAllDrives=True).execute()
+        return meta.get('md5Checksum') or meta.get('headRevisionId') or meta.get('modifiedTime')
+    def baixar(self, revisao):
+        """Bytes do xlsx. Guarda a última revisão baixada: gravar logo depois de ler não baixa o arquivo de novo."""
+        if revisao is None or self.baixado[0] != revisao: self.baixado = (revisao, self.service.files().get_media(fileId=self.file_id).execute())
+        return self.baixado[1]
+    def enviar(self, buf):
+        media = MediaIoBaseUpload(buf, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', resumable=True)
+        self.service.files().update(fileId=self.file_id, media_body=media, supportsAllDrives=True).execute()
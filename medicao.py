@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+# Medição de desempenho: uma linha JSON por operação (vazio desliga o arquivo)
+ARQUIVO_METRICAS = os.environ.get("ARQUIVO_METRICAS", "metricas.jsonl")
+METRICAS_MINIMO_MS = float(os.environ.get("METRICAS_MINIMO_MS", 5))  # operações mais rápidas (cache em memória) não são registradas
+METRICAS_NO_PAINEL = 50
+
+# --- MEDIÇÃO DE DESEMPENHO (TEMPO POR ETAPA) ---
+_medicao_local = threading.local()
+
+@lru_cache(maxsize=1)
+def estado_metricas():
+    return {'lock': threading.Lock(), 'recentes': deque(maxlen=METRICAS_NO_PAINEL)}
+
+class Medicao:
+    """Tempo (ms) de cada etapa e contadores de uma operação: `with Medicao("salvar_excel", aba=...) as m: with m.etapa("upload"): ...`.
+    Ao sair vai para o painel de desempenho e para o ARQUIVO_METRICAS. Conta as requisições ao Drive feitas dentro dela."""
+    def __init__(self, operacao, **dados):
+        self.operacao, self.dados, self.etapas, self.lock = operacao, dados, {}, threading.Lock()
+    def __enter__(self):
+        self.anterior = getattr(_medicao_local, 'atual', None); _medicao_local.atual = self
+        self.inicio = time.perf_counter(); return self
+    def __exit__(self, tipo, erro, tb):
+        _medicao_local.atual = self.anterior
+        total = (time.perf_counter() - self.inicio) * 1000
+        if total < METRICAS_MINIMO_MS and erro is None: return
+        registrar_medicao({'quando': datetime.now().isoformat(timespec='seconds'), 'operacao': self.operacao, 'total_ms': round(total, 1),
+                           'etapas': {k: round(v, 1) for k, v in self.etapas.items()}, 'dados': self.dados, 'erro': repr(erro) if erro else None})
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try: yield
+        finally: self.etapas[nome] = self.etapas.get(nome, 0) + (time.perf_counter() - inicio) * 1000
+    def contar(self, nome, n=1):
+        with self.lock: self.dados[nome] = self.dados.get(nome, 0) + n
+    @contextmanager
+    def nesta_thread(self):
+        """Para threads de trabalho: as requisições ao Drive feitas dentro do bloco contam nesta medição."""
+        anterior = getattr(_medicao_local, 'atual', None); _medicao_local.atual = self
+        try: yield self
+        finally: _medicao_local.atual = anterior
+
+def contar_requisicao_drive():
+    m = getattr(_medicao_local, 'atual', None)
+    if m: m.contar('requisicoes_drive')
+
+def registrar_medicao(registro):
+    estado = estado_metricas()
+    with estado['lock']:
+        estado['recentes'].append(registro)
+        if not ARQUIVO_METRICAS: return
+        try:
+            with open(ARQUIVO_METRICAS, "a", encoding="utf-8") as f: f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError: pass
@@ -0,0 +1,407 @@
+import io
+import os
+import re
+import bisect
+import numpy as np
+import pandas as pd
+import openpyxl
+import xml.etree.ElementTree as ET
+try:  # internos do openpyxl 3.1 (versão fixada no requirements.txt); sem eles a leitura volta ao pd.read_excel
+    from openpyxl.reader.excel import ExcelReader
+    from openpyxl.styles.stylesheet import apply_stylesheet
+    from openpyxl.cell.text import Text
+except ImportError: ExcelReader = None
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import from_excel, from_ISO8601
+from datetime import datetime, date
+from calculos import COLS_CALCULADAS, aplicar_formulas
+
+# Leitura, busca e gravação (mescla por célula) da planilha do laboratório.
+
+# --- TIPOS DAS COLUNAS (NORMALIZADOS NA CARGA) ---
+COLS_DATA = ["Data de entrada", "Início da análise", "Fim da análise", "Data de Registro"]
+COLS_CATEGORIA = ["Nome do Cliente", "Aplicação", "Madeira", "Produto"]  # textos que se repetem muito
+# Grau fica fora: vai impresso como veio no laudo (3, e não 3.0)
+COLUNAS_NUMERICAS = ['Cromo (%)', 'Cobre (%)', 'Arsênio (%)'] + \
+    [f'{p} {x} ({u})' for p, u in [('Diâmetro', 'mm'), ('Comprim.', 'mm'), ('Massa', 'g')] for x in range(1, 6)] + \
+    ['Diâmetro médio (cm)', 'Comprim. Médio (cm)', 'Massa média (g)', 'Volume (cm³)', 'Densidade (g/cm³)', 'Densidade (Kg/m³)',
+     'Soma Concentração', 'Balanço Cromo %', 'Balanço Cobre %', 'Balanço Arsênio %', 'Balanço Total',
+     'Retenção Cromo (Kg/m³)', 'Retenção Cobre (Kg/m³)', 'Retenção Arsênio (Kg/m³)', 'Retenção Total (Kg/m³)', 'Retenção', 'Retenção Esp.',
+     'pH da solução', 'Temperatura', 'Densidade  solução (g/cm³)', 'Concentração pela tabela']
+
+def normalizar_tipos(df):
+    """Converte uma vez, na carga, o que o resto do app trataria célula a célula: números (inclusive texto com vírgula
+    decimal) viram float64, datas viram datetime64 e os textos repetidos viram category.
+    Uma coluna numérica só é convertida se todos os valores preenchidos forem números; senão fica como veio."""
+    for col in [c for c in COLS_DATA if c in df.columns]:
+        df[col] = pd.to_datetime(df[col], errors='coerce').dt.normalize()
+    for col in [c for c in COLUNAS_NUMERICAS if c in df.columns]:
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s): continue
+        texto = s.astype(object).where(s.notna(), "").astype(str).str.strip()
+        num = pd.to_numeric(texto.str.replace(",", ".", regex=False), errors='coerce')
+        if (num.notna() | (texto == "")).all(): df[col] = num.astype('float64')
+    for col in [c for c in COLS_CATEGORIA if c in df.columns]:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(s): continue
+        if s.dropna().map(type).eq(str).all(): df[col] = s.astype('category')
+    return df
+
+# --- LEITURA (SÓ A ABA E AS COLUNAS PEDIDAS) ---
+# Colunas de uma aba que pertencem à outra (não são lidas)
+COLS_PROIBIDAS = {
+    "Madeira Tratada": ['pH da solução', 'Densidade  solução (g/cm³)', 'Temperatura', 'Concentração pela tabela'],
+    "Solução Preservativa": ['Diâmetro 1 (mm)', 'Massa 1 (g)', 'Retenção', 'Retenção Esp.'],
+}
+# Textos que o read_excel trata como vazio (inclui os erros de fórmula do Excel)
+TEXTOS_NULOS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+                '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#NULL!'}
+
+NS_PLANILHA = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def valor_celula_xml(c, textos, livro):
+    """Valor de um <c> do XML da aba, convertido como o openpyxl (data_only) + read_excel fariam: número inteiro vira int, erro vira vazio."""
+    tipo = c.get('t', 'n')
+    if tipo == 'inlineStr':
+        texto = c.find(NS_PLANILHA + 'is')
+        if texto is None: return None
+        if len(texto) == 1 and texto[0].tag == NS_PLANILHA + 't': return texto[0].text or ""  # texto simples (o caso comum)
+        return Text.from_tree(texto).content
+    v = c.findtext(NS_PLANILHA + 'v') or None
+    if v is None or tipo == 'e': return None
+    if tipo == 's': return textos[int(v)]
+    if tipo == 'str': return v
+    if tipo == 'b': return bool(int(v))
+    if tipo == 'd': return from_ISO8601(v)
+    n = float(v) if ('.' in v or 'E' in v or 'e' in v) else int(v)
+    estilo = int(c.get('s', 0))
+    if estilo in livro._date_formats:
+        try: return from_excel(n, livro.epoch, timedelta=estilo in livro._timedelta_formats)
+        except (OverflowError, ValueError): return None
+    return int(n) if type(n) is float and n.is_integer() else n
+
+def ler_colunas_read_excel(conteudo, aba_nome, descartar=()):
+    """A leitura de antes (pd.read_excel da aba inteira), sem as colunas 'Unnamed' e as de `descartar`."""
+    df = pd.read_excel(io.BytesIO(conteudo), sheet_name=aba_nome)
+    df.columns = df.columns.str.strip()
+    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+    return df.drop(columns=[c for c in descartar if c in df.columns])
+
+def ler_colunas_aba(conteudo, aba_nome, descartar=()):
+    """Lê as colunas da aba pelo XML (ler_colunas_xml) ou, se os internos do openpyxl mudaram, pelo pd.read_excel."""
+    if ExcelReader is not None:
+        try: return ler_colunas_xml(conteudo, aba_nome, descartar)
+        except AttributeError: pass
+    return ler_colunas_read_excel(conteudo, aba_nome, descartar)
+
+def ler_colunas_xml(conteudo, aba_nome, descartar=()):
+    """Lê só a aba pedida direto do XML, em streaming e sem montar células nem estilos, convertendo apenas as colunas com cabeçalho
+    que não estão em `descartar`. Dá o mesmo DataFrame que o ler_colunas_read_excel (conferido pelo benchmarks/conferir_leitura.py)."""
+    leitor = ExcelReader(io.BytesIO(conteudo), read_only=True, data_only=True, keep_links=False)
+    try:
+        leitor.read_manifest(); leitor.read_strings(); leitor.read_workbook()
+        apply_stylesheet(leitor.archive, leitor.wb)  # só para saber quais estilos são de data
+        caminho = next((rel.target for aba, rel in leitor.parser.find_sheets() if aba.name == aba_nome), None)
+        if caminho is None: raise ValueError(f"Worksheet named '{aba_nome}' not found")
+        posicoes, nomes, colunas, vistos, indice_ref = {}, [], [], {}, {}
+        linha_atual, total, n_linhas = -1, 0, 0
+        with leitor.archive.open(caminho) as xml:
+            for evento, el in ET.iterparse(xml, events=("start", "end")):
+                if evento == "start":
+                    if el.tag == NS_PLANILHA + 'sheetData': dados = el
+                    continue
+                if el.tag != NS_PLANILHA + 'row': continue
+                r = el.get('r'); linha_atual = int(r) - 1 if r else linha_atual + 1
+                valores, cheia, col = {}, False, -1
+                for c in el:
+                    ref = c.get('r')
+                    if ref:
+                        letras = ref.rstrip("0123456789")
+                        col = indice_ref.get(letras)
+                        if col is None: col = indice_ref[letras] = column_index_from_string(letras) - 1
+                    else: col += 1
+                    if linha_atual == 0 or col in posicoes:
+                        v = valor_celula_xml(c, leitor.shared_strings, leitor.wb)
+                        if v is not None: valores[col] = v; cheia = True
+                        elif c.get('t') == 'e': cheia = True
+                    elif not cheia and (c.find(NS_PLANILHA + 'v') is not None or c.find(NS_PLANILHA + 'is') is not None): cheia = True
+                dados.clear()
+                if linha_atual == 0:
+                    for col in sorted(valores):
+                        nome = str(valores[col]).strip()
+                        if nome == "" or nome in descartar: continue  # sem cabeçalho viraria "Unnamed: n" no read_excel
+                        vistos[nome] = vistos.get(nome, -1) + 1
+                        posicoes[col] = len(nomes); nomes.append(f"{nome}.{vistos[nome]}" if vistos[nome] else nome); colunas.append([])
+                    continue
+                if linha_atual < 1: continue
+                if linha_atual - 1 > total:  # linhas que nem existem no XML contam como vazias
+                    for lista in colunas: lista.extend([None] * (linha_atual - 1 - total))
+                    total = linha_atual - 1
+                for col, pos in posicoes.items(): colunas[pos].append(valores.get(col))
+                total += 1
+                if cheia: n_linhas = total  # linhas vazias no fim são descartadas, as do meio ficam (como no read_excel)
+    finally:
+        leitor.archive.close()
+    series = {}
+    for nome, lista in zip(nomes, colunas):
+        del lista[n_linhas:]; series[nome] = pd.Series(lista); lista.clear()
+    df = pd.DataFrame(series, columns=nomes)
+    # Mesmas conversões do read_excel, só nas colunas lidas: textos nulos e texto numérico vira número
+    for col in nomes:
+        s = df[col]
+        if s.dtype != object and not pd.api.types.is_string_dtype(s): continue
+        texto = s.map(type).eq(str)
+        if texto.any(): s = s.mask(texto & s.isin(TEXTOS_NULOS), None)
+        try: df[col] = pd.to_numeric(s)
+        except (ValueError, TypeError): s = s.infer_objects(); df[col] = s.where(s.notna(), np.nan) if s.dtype == object else s
+    return df
+
+def ler_aba_xlsx(conteudo, aba_nome):
+    """Aba do xlsx (bytes) como o app usa: sem as colunas da outra aba e com os tipos normalizados."""
+    return normalizar_tipos(ler_colunas_aba(conteudo, aba_nome, COLS_PROIBIDAS.get(aba_nome, ())))
+
+# --- BUSCA (ÍNDICE POR REVISÃO) ---
+class IndiceAmostras:
+    """Índice em memória de uma aba, montado uma vez por revisão. As consultas devolvem posições (iloc) ordenadas."""
+    COLS_TEXTO = COLS_CATEGORIA
+
+    def __init__(self, df):
+        self.n = len(df)
+        codigos = df['Código UFV'].fillna("").astype(str).str.strip() if 'Código UFV' in df.columns else pd.Series("", index=df.index)
+        self.codigos = codigos.str.upper().tolist()
+        # Número final do código (UFV-M-620 -> "620"): ordenado como número (exato/faixa) e como texto (prefixo)
+        sufixo = codigos.str.extract(r'(\d+)\s*$')[0]
+        # Sufixo com mais de 18 dígitos não cabe em int64 (e, junto dos outros, viraria float): só entra na busca por prefixo/texto
+        cabe = sufixo.str.lstrip("0").str.len() <= 18
+        tem = (sufixo.notna() & cabe).to_numpy()
+        nums = pd.to_numeric(sufixo[tem], errors='coerce').to_numpy(dtype=np.int64)
+        ordem = np.argsort(nums, kind='stable')
+        self.num_val, self.num_pos = nums[ordem], np.flatnonzero(tem)[ordem]
+        tem = sufixo.notna().to_numpy()
+        pos = np.flatnonzero(tem)
+        sufs = sufixo[tem].tolist()
+        ordem = sorted(range(len(sufs)), key=sufs.__getitem__)
+        self.suf_val, self.suf_pos = [sufs[i] for i in ordem], pos[ordem]
+        # Texto: valor normalizado -> posições
+        self.textos = {}
+        for col in self.COLS_TEXTO:
+            if col in df.columns:
+                chave = df[col].astype(object).fillna("").astype(str).str.strip().str.lower().reset_index(drop=True)
+                self.textos[col] = {k: np.asarray(v) for k, v in chave.groupby(chave, sort=True).indices.items() if k not in ("", "nan", "none")}
+        self.valores_originais = {col: sorted({str(v).strip() for v in df[col].dropna() if str(v).strip()}) for col in self.COLS_TEXTO if col in df.columns}
+        # Data de entrada ordenada
+        datas = pd.to_datetime(df['Data de entrada'], errors='coerce').to_numpy() if 'Data de entrada' in df.columns else np.array([], dtype='datetime64[ns]')
+        tem = ~np.isnat(datas)
+        pos = np.flatnonzero(tem)
+        ordem = np.argsort(datas[tem], kind='stable')
+        self.data_val, self.data_pos = datas[tem][ordem], pos[ordem]
+
+    def por_faixa(self, inicio, fim):
+        if inicio > fim: inicio, fim = fim, inicio
+        i, j = np.searchsorted(self.num_val, inicio, side='left'), np.searchsorted(self.num_val, fim, side='right')
+        return np.sort(self.num_pos[i:j])
+
+    def por_prefixo(self, prefixo):
+        i, j = bisect.bisect_left(self.suf_val, prefixo), bisect.bisect_left(self.suf_val, prefixo + "\uffff")
+        return np.sort(self.suf_pos[i:j])
+
+    def por_codigo_contendo(self, termo):
+        termo = termo.upper()
+        return np.array([i for i, c in enumerate(self.codigos) if termo in c], dtype=np.int64)
+
+    def por_texto(self, col, termo):
+        """Linhas em que a coluna contém o termo (sem diferenciar maiúsculas). Varre só os valores distintos."""
+        grupos = self.textos.get(col, {}); termo = str(termo).strip().lower()
+        achados = [p for k, p in grupos.items() if termo in k]
+        return self._unir(achados)
+
+    def por_valores(self, col, valores):
+        grupos = self.textos.get(col, {})
+        achados = [grupos[str(v).strip().lower()] for v in valores if str(v).strip().lower() in grupos]
+        return self._unir(achados)
+
+    @staticmethod
+    def _unir(grupos):
+        if not grupos: return np.array([], dtype=np.int64)
+        return grupos[0] if len(grupos) == 1 else np.sort(np.concatenate(grupos))
+
+    def por_data(self, inicio=None, fim=None):
+        i = np.searchsorted(self.data_val, np.datetime64(pd.Timestamp(inicio)), side='left') if inicio else 0
+        j = np.searchsorted(self.data_val, np.datetime64(pd.Timestamp(fim) + pd.Timedelta(days=1)), side='left') if fim else len(self.data_val)
+        return np.sort(self.data_pos[i:j])
+
+    def buscar_codigo(self, termo):
+        """Mesma regra da busca antiga: "620" acha UFV-M-620, UFV-M-6201...; "600-650" é faixa; senão procura o texto no código."""
+        termo = str(termo).strip()
+        faixa = re.fullmatch(r'(\d+)\s*-\s*(\d+)', termo)
+        if faixa: return self.por_faixa(int(faixa.group(1)), int(faixa.group(2)))
+        numero = re.sub(r'^UFV-M-', '', termo, flags=re.IGNORECASE)
+        if numero.isdigit():
+            achados = self.por_prefixo(numero)
+            if len(achados): return achados
+        return self.por_codigo_contendo(termo)
+
+    def filtrar(self, codigo="", cliente="", aplicacoes=(), datas=()):
+        """Combina os filtros preenchidos (E lógico). Sem filtros, devolve todas as linhas."""
+        partes = []
+        if codigo: partes.append(self.buscar_codigo(codigo))
+        if cliente: partes.append(self.por_texto("Nome do Cliente", cliente))
+        if aplicacoes: partes.append(self.por_valores("Aplicação", aplicacoes))
+        if datas: partes.append(self.por_data(*datas))
+        if not partes: return np.arange(self.n)
+        if len(partes) == 1: return partes[0]
+        contagem = np.zeros(self.n, dtype=np.int8)
+        for p in partes: contagem[p] += 1
+        return np.flatnonzero(contagem == len(partes))
+
+# --- GRAVAÇÃO (MESCLA CÉLULA A CÉLULA) ---
+SALVAMENTO_TENTATIVAS = 3  # remesclas se a planilha mudar entre o download e o envio
+
+def linhas_por_codigo(df):
+    """{Código UFV: {coluna: valor}} das linhas do df (sem a coluna de seleção da tela)."""
+    return {str(l.get('Código UFV')).strip(): l for l in df.drop(columns=['Selecionar'], errors='ignore').to_dict('records')}
+
+def valor_celula(v):
+    """Converte um valor do DataFrame no que o openpyxl grava (NaN/NaT viram célula vazia)."""
+    if v is None: return None
+    try:
+        if pd.isna(v): return None
+    except (TypeError, ValueError): pass
+    if isinstance(v, pd.Timestamp): return v.to_pydatetime()
+    if isinstance(v, np.generic): return v.item()
+    return v
+
+def mesmo_valor(antigo, novo):
+    if isinstance(antigo, str) and antigo.strip() == "": antigo = None
+    if isinstance(novo, date) and not isinstance(novo, datetime) and isinstance(antigo, datetime):
+        return antigo.date() == novo and antigo.time() == datetime.min.time()
+    if isinstance(antigo, bool) != isinstance(novo, bool): return False
+    if isinstance(antigo, str) and isinstance(novo, (int, float)):  # "1,19" na planilha e 1.19 carregado (tipos normalizados)
+        try: return float(antigo.strip().replace(",", ".")) == novo
+        except ValueError: return False
+    return antigo == novo
+
+SEM_BASE = object()  # valor carregado desconhecido: a célula é gravada sem conferir (duas vias)
+
+def alteracoes_celulas(df_base, df_final):
+    """{Código UFV: {coluna: (valor carregado, valor novo)}} só das células que mudaram em relação ao df_base.
+    Sem df_base, todas as células do df_final entram como alteração sem base conhecida."""
+    base = {} if df_base is None else linhas_por_codigo(df_base)
+    alteracoes = {}
+    for codigo, linha in linhas_por_codigo(df_final).items():
+        original = base.get(codigo)
+        for col, val in linha.items():
+            novo = valor_celula(val)
+            antes = SEM_BASE if original is None else valor_celula(original.get(col))
+            if antes is not SEM_BASE and mesmo_valor(antes, novo): continue
+            alteracoes.setdefault(codigo, {})[col] = (antes, novo)
+    return alteracoes
+
+def escrever_mescla(ws, alteracoes, tres_vias=False, novas=()):
+    """Grava as alterações ({Código UFV: {coluna: (valor carregado, valor novo)}}) na versão atual da aba.
+    Com tres_vias (a planilha mudou desde o carregamento), só grava onde a célula ainda tem o valor carregado;
+    onde outra pessoa mudou para outro valor é conflito e a célula fica como está. Códigos em `novas` que não estão
+    na aba viram linhas no fim dela (os demais códigos desconhecidos são ignorados).
+    Retorna (células alteradas, conflitos, linhas novas, {Código UFV: nº da linha} dos códigos gravados)."""
+    col_map = {str(cell.value).strip(): idx for idx, cell in enumerate(ws[1], 1) if cell.value}
+    col_id_idx = col_map.get("Código UFV")
+    if not col_id_idx: return 0, [], 0, {}
+    
+    excel_rows = {}
+    for row_idx, (cod,) in enumerate(ws.iter_rows(min_row=2, min_col=col_id_idx, max_col=col_id_idx, values_only=True), 2):
+        if cod: excel_rows[str(cod).strip()] = row_idx
+    
+    alteradas, conflitos, acrescentadas, linhas = 0, [], 0, {}
+    proxima = None
+    for codigo, celulas in alteracoes.items():
+        linha = excel_rows.get(codigo)
+        if not linha and codigo in novas:
+            if proxima is None:  # primeira linha totalmente vazia depois dos dados (linhas só formatadas não contam)
+                proxima = 1 + max((i for i, valores in enumerate(ws.iter_rows(values_only=True), 1) if any(v is not None for v in valores)), default=1)
+            linha = excel_rows[codigo] = proxima; proxima += 1; acrescentadas += 1
+            ws.cell(row=linha, column=col_id_idx).value = codigo
+        if not linha: continue
+        linhas[codigo] = linha
+        for col, (antes, val) in celulas.items():
+            if col not in col_map: continue
+            cell = ws.cell(row=linha, column=col_map[col])
+            if mesmo_valor(cell.value, val): continue
+            if tres_vias and antes is not SEM_BASE and not mesmo_valor(cell.value, antes):
+                conflitos.append({'codigo': codigo, 'coluna': col, 'planilha': cell.value, 'carregado': antes, 'novo': val})
+                continue
+            cell.value = val
+            if isinstance(val, (date, datetime)): cell.number_format = 'DD/MM/YYYY'
+            alteradas += 1
+    return alteradas, conflitos, acrescentadas, linhas
+
+def recalcular_linhas(ws, linhas):
+    """Roda as fórmulas nas linhas ({Código UFV: nº da linha}) como estão agora na aba, depois da mescla, e grava as
+    COLS_CALCULADAS que mudaram. Assim o resultado de cada linha sempre bate com as entradas dela, mesmo quando
+    parte das entradas veio de outro salvamento. Só grava onde a fórmula calculou (Observação, Densidade (Kg/m³)... digitadas
+    nas outras linhas ficam como estão). Retorna (células alteradas, erros de cálculo, {(Código UFV, coluna)} calculadas)."""
+    if not linhas: return 0, [], set()
+    col_map = {str(cell.value).strip(): idx for idx, cell in enumerate(ws[1], 1) if cell.value}
+    cols = list(col_map)
+    df = pd.DataFrame([[ws.cell(row=r, column=col_map[c]).value for c in cols] for r in linhas.values()], columns=cols)
+    escritas = {}
+    df, erros = aplicar_formulas(normalizar_tipos(df.where(df.notna(), np.nan)), escritas)
+    alteradas, calculadas = 0, set()
+    for col in [c for c in COLS_CALCULADAS if c in col_map and c in escritas]:
+        for (codigo, r), v, calculou in zip(linhas.items(), df[col].tolist(), escritas[col]):
+            if not calculou: continue
+            calculadas.add((codigo, col))
+            cell = ws.cell(row=r, column=col_map[col]); novo = valor_celula(v)
+            if mesmo_valor(cell.value, novo): continue
+            cell.value = novo; alteradas += 1
+    return alteradas, erros, calculadas
+
+def gravar_com_mescla(origem, alteracoes, aba_nome, m, revisao_base=None, novas=()):
+    """Ida e volta do workbook: baixa a revisão atual, grava só as células alteradas e envia.
+    `origem` é a planilha (PlanilhaDrive, PlanilhaLocal): revisao(), baixar(revisao) e enviar(buf).
+    Códigos em `novas` que não existem na aba são acrescentados no fim.
+    Se a revisão não é mais a carregada (revisao_base), mescla célula a célula em três vias; confere a revisão
+    de novo logo antes de enviar e, se alguém salvou nesse meio tempo, mescla outra vez em cima da versão nova.
+    As fórmulas rodam aqui, nas linhas mescladas: `alteracoes` só precisa trazer as entradas.
+    Retorna (células alteradas, conflitos, erros de cálculo)."""
+    for tentativa in range(SALVAMENTO_TENTATIVAS):
+        with m.etapa("revisao"): revisao = origem.revisao()
+        with m.etapa("download"): conteudo = origem.baixar(revisao)
+        with m.etapa("load_workbook"):
+            try: wb = openpyxl.load_workbook(io.BytesIO(conteudo))
+            except Exception as e: raise RuntimeError("Arquivo corrompido") from e
+
+        if aba_nome not in wb.sheetnames: raise RuntimeError("Aba não encontrada")
+        tres_vias = revisao_base is None or revisao != revisao_base
+        with m.etapa("escrever_celulas"): alteradas, conflitos, acrescentadas, linhas = escrever_mescla(wb[aba_nome], alteracoes, tres_vias, novas)
+        with m.etapa("formulas"): calculadas, erros, refeitas = recalcular_linhas(wb[aba_nome], linhas)
+        # Conflito numa célula que a fórmula acabou de refazer não é conflito: ela saiu das entradas mescladas
+        conflitos = [c for c in conflitos if (c['codigo'], c['coluna']) not in refeitas]
+        alteradas += calculadas
+        m.dados.update(celulas_alteradas=alteradas, celulas_calculadas=calculadas, linhas_novas=acrescentadas, conflitos=len(conflitos), tres_vias=tres_vias)
+        if alteradas == 0: return 0, conflitos, erros
+        
+        with m.etapa("wb_save"): buf = io.BytesIO(); wb.save(buf); buf.seek(0)
+        m.dados['bytes'] = buf.getbuffer().nbytes
+        with m.etapa("revisao"):
+            if origem.revisao() != revisao: m.contar('remesclas'); continue
+        with m.etapa("upload"): origem.enviar(buf)
+        return alteradas, conflitos, erros
+    raise RuntimeError("A planilha mudou durante o salvamento; tente de novo")
+
+def descrever_conflito(c):
+    return f"{c['codigo']} / {c['coluna']}: no Drive está {c['planilha']!r}, você mudou de {c['carregado']!r} para {c['novo']!r}"
+
+# --- PLANILHA LOCAL (ARQUIVO) ---
+class PlanilhaLocal:
+    """Um xlsx em disco como origem do gravar_com_mescla (mesma interface da PlanilhaDrive). A revisão é tamanho + mtime."""
+    def __init__(self, caminho):
+        self.caminho = caminho
+    def revisao(self):
+        info = os.stat(self.caminho)
+        return f"{info.st_size}-{info.st_mtime_ns}"
+    def baixar(self, revisao):
+        with open(self.caminho, "rb") as f: return f.read()
+    def enviar(self, buf):
+        tmp = self.caminho + ".tmp"
+        with open(tmp, "wb") as f: f.write(buf.getbuffer())
+        os.replace(tmp, self.caminho)
@@ -0,0 +1,137 @@
+"""Recalcula amostras da aba Madeira Tratada e emite os relatórios sem abrir a tela (rodadas noturnas em lote).
+
+    python processar_amostras.py --de 01/03/2024 --ate 31/03/2024 --pasta-pdf relatorios/
+    python processar_amostras.py --codigos 600-650 --gravar-planilha --enviar-drive --json resumo.json
+    python processar_amostras.py --planilha copia.xlsx --gravar-planilha     # arquivo local, sem Drive
+
+Sem --planilha, usa a planilha do Drive com a conta de serviço de --credenciais (JSON), da variável
+GOOGLE_APPLICATION_CREDENTIALS ou da seção [gcp_service_account] de .streamlit/secrets.toml (a mesma do app).
+O progresso vai para a saída padrão e o resumo (JSON) para --json, ou é impresso no fim.
+Sai com código 1 se algum cálculo, gravação, relatório ou envio falhar.
+
+Usa os mesmos módulos do app.py (calculos, planilha, drive, relatorio_pdf, medicao), que não importam o streamlit.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tomllib
+from datetime import datetime
+
+from calculos import aplicar_formulas
+from drive import PlanilhaDrive, conectar, enviar_pdfs
+from medicao import Medicao
+from planilha import IndiceAmostras, PlanilhaLocal, alteracoes_celulas, descrever_conflito, gravar_com_mescla, ler_aba_xlsx
+from relatorio_pdf import chave_relatorio, gerar_pdfs_lote, get_val
+
+ABA = "Madeira Tratada"
+SECRETS_STREAMLIT = os.path.join(".streamlit", "secrets.toml")
+
+
+def data_arg(texto):
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try: return datetime.strptime(texto.strip(), fmt).date()
+        except ValueError: continue
+    raise argparse.ArgumentTypeError(f"data inválida: {texto!r} (use AAAA-MM-DD ou DD/MM/AAAA)")
+
+
+def credenciais(caminho=None):
+    """Dict da conta de serviço: --credenciais, GOOGLE_APPLICATION_CREDENTIALS ou o secrets.toml do app."""
+    caminho = caminho or os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
+    if caminho:
+        with open(caminho, encoding="utf-8") as f: return json.load(f)
+    with open(SECRETS_STREAMLIT, "rb") as f: return tomllib.load(f)["gcp_service_account"]
+
+
+def progresso(rotulo):
+    """Callback ao_progredir que imprime ~20 linhas por etapa, não uma por item."""
+    def mostrar(feitos, total):
+        if feitos == total or feitos % max(1, total // 20) == 0: print(f"  {rotulo}: {feitos}/{total}", flush=True)
+    return mostrar
+
+
+def processar(args, resumo):
+    service = conectar(credenciais(args.credenciais)) if not args.planilha or args.enviar_drive else None
+    origem = PlanilhaLocal(args.planilha) if args.planilha else PlanilhaDrive(service)
+    with Medicao("processar_amostras", aba=ABA) as m:
+        print(f"Lendo {ABA} de {args.planilha or 'Drive'}...", flush=True)
+        with m.etapa("carregar"):
+            revisao = origem.revisao()
+            df = ler_aba_xlsx(origem.baixar(revisao), ABA)
+        datas = (args.de, args.ate) if args.de or args.ate else ()
+        sel = df.iloc[IndiceAmostras(df).filtrar(codigo=args.codigos or "", datas=datas)]
+        resumo.update(revisao=revisao, linhas_planilha=len(df), amostras=len(sel), codigos=sel['Código UFV'].astype(str).tolist() if len(sel) else [])
+        m.dados['amostras'] = len(sel)
+        print(f"{len(sel)} de {len(df)} amostra(s) no filtro.", flush=True)
+        if sel.empty: return
+
+        with m.etapa("formulas"): calculado, erros = aplicar_formulas(sel.copy())
+        resumo['erros_calculo'] = erros
+        print(f"Recalculadas: {len(calculado)} ({len(erros)} erro(s) de cálculo).", flush=True)
+        for erro in erros: print(f"  {erro}", flush=True)
+
+        if args.gravar_planilha:
+            print("Gravando as células alteradas na planilha...", flush=True)
+            alteradas, conflitos, _ = gravar_com_mescla(origem, alteracoes_celulas(sel, calculado), ABA, m, revisao)
+            resumo['planilha'] = {'celulas_alteradas': alteradas, 'conflitos': [descrever_conflito(c) for c in conflitos]}
+            print(f"  {alteradas} célula(s) alterada(s), {len(conflitos)} conflito(s).", flush=True)
+
+        if not (args.pasta_pdf or args.enviar_drive): return
+        linhas = calculado.to_dict('records')
+        print(f"Gerando {len(linhas)} relatório(s)...", flush=True)
+        with m.etapa("pdfs"): resultados = gerar_pdfs_lote(linhas, ao_progredir=progresso("relatórios"), max_workers=args.workers)
+        prontos = [(l, nome, pdf) for l, (nome, pdf, _) in zip(linhas, resultados) if pdf is not None]
+        resumo['pdfs'] = {'gerados': len(prontos), 'falhas': [{'nome': nome, 'erro': erro} for nome, _, erro in resultados if erro]}
+        if args.pasta_pdf:
+            os.makedirs(args.pasta_pdf, exist_ok=True)
+            for _, nome, pdf in prontos:
+                with open(os.path.join(args.pasta_pdf, nome), "wb") as f: f.write(pdf)
+            print(f"  {len(prontos)} PDF(s) em {args.pasta_pdf}", flush=True)
+
+        if args.enviar_drive and prontos:
+            print(f"Enviando {len(prontos)} PDF(s) para o Drive...", flush=True)
+            arquivos = [(pdf, nome, get_val(l, ["Data de entrada"]), chave_relatorio(l)) for l, nome, pdf in prontos]
+            with m.etapa("drive"): envios = enviar_pdfs(service, arquivos, ao_progredir=progresso("Drive"))
+            situacoes = [r['situacao'] for r in envios if r['ok']]
+            resumo['drive'] = {'novo': situacoes.count('novo'), 'atualizado': situacoes.count('atualizado'), 'igual': situacoes.count('igual'),
+                               'falhas': [{'nome': r['nome'], 'pasta': r['pasta'], 'erro': r['erro']} for r in envios if not r['ok']]}
+    resumo['etapas_ms'] = {k: round(v, 1) for k, v in m.etapas.items()}
+
+
+def houve_falha(resumo):
+    return bool(resumo.get('erro') or resumo.get('erros_calculo') or resumo.get('planilha', {}).get('conflitos')
+                or resumo.get('pdfs', {}).get('falhas') or resumo.get('drive', {}).get('falhas'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--de", type=data_arg, help="data de entrada inicial (inclusive)")
+    parser.add_argument("--ate", type=data_arg, help="data de entrada final (inclusive)")
+    parser.add_argument("--codigos", help='códigos como na busca da tela: "620", "600-650" ou "UFV-M-620"')
+    parser.add_argument("--planilha", help="xlsx local no lugar da planilha do Drive")
+    parser.add_argument("--credenciais", help="JSON da conta de serviço do Google")
+    parser.add_argument("--gravar-planilha", action="store_true", help="grava na planilha as células que o recálculo mudou")
+    parser.add_argument("--pasta-pdf", help="grava os relatórios nesta pasta")
+    parser.add_argument("--enviar-drive", action="store_true", help="envia os relatórios para as pastas ano/mês do Drive")
+    parser.add_argument("--workers", type=int, help="processos na geração dos PDFs (padrão: um por CPU)")
+    parser.add_argument("--json", help="grava o resumo neste arquivo (senão, imprime no fim)")
+    args = parser.parse_args()
+
+    resumo = {'aba': ABA, 'origem': args.planilha or "drive", 'filtro': {'de': args.de, 'ate': args.ate, 'codigos': args.codigos}}
+    inicio = time.perf_counter()
+    try: processar(args, resumo)
+    except Exception as e:
+        resumo['erro'] = f"{type(e).__name__}: {e}"
+        print(f"Erro: {resumo['erro']}", file=sys.stderr, flush=True)
+    resumo['duracao_s'] = round(time.perf_counter() - inicio, 2)
+    texto = json.dumps(resumo, indent=2, ensure_ascii=False, default=str)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: f.write(texto)
+        print(f"Resumo em {args.json} ({resumo['duracao_s']} s).", flush=True)
+    else: print(texto, flush=True)
+    return 1 if houve_falha(resumo) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import pandas as pd
+from fpdf import FPDF
+import io
+import os
+import multiprocessing
+import hashlib
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, date
+from functools import lru_cache
+
+# --- PDF E HELPERS ---
+def clean_text(text): return str(text).encode('latin-1', 'replace').decode('latin-1') if not pd.isna(text) else ""
+def fmt_num(v): 
+    try: return "{:,.2f}".format(float(str(v).replace(",", "."))).replace(",", "X").replace(".", ",").replace("X", ".")
+    except: return str(v)
+def fmt_date(v):
+    if pd.isna(v) or v is None or str(v).strip() in ["", "NaT", "None"]: return "-"
+    if isinstance(v, (datetime, date)): return v.strftime("%d/%m/%Y")
+    s = str(v).strip().split(" ")[0]
+    for f in ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y"]:
+        try: return datetime.strptime(s, f).strftime("%d/%m/%Y")
+        except: continue
+    return s
+
+def normalizar(d):
+    return {str(k).strip().lower(): v for k, v in d.items()}
+
+def valor(dn, keys):
+    """get_val sobre um dict já normalizado (normalizar(d)), para não refazer o dict a cada busca."""
+    for k in keys:
+        k = k.strip().lower()
+        if k in dn:
+            val = dn[k]
+            if not pd.isna(val) and str(val).strip() not in ["", "NaT"]: return val
+    return ""
+
+def get_val(d, keys): return valor(normalizar(d), keys)
+
+# --- MODELO (PARTES FIXAS, PREPARADAS UMA VEZ POR PROCESSO) ---
+LOGOS = [("logo_ufv.png", 10, 8, 25), ("logo_montana.png", 155, 8, 45)]
+PARTES_QUIMICA = {
+    "Cr": [("Teor de CrO", 8, 0), ("3", 5, 1.5), (" (Cromo)", 8, 0)],
+    "Cu": [("Teor de CuO (Cobre)", 8, 0)],
+    "As": [("Teor de As", 8, 0), ("2", 5, 1.5), ("O", 8, 0), ("5", 5, 1.5), (" (Arsênio)", 8, 0)],
+}
+
+@lru_cache(maxsize=None)
+def rotulo(txt): return clean_text(txt)
+
+class ModeloRelatorio:
+    """Logos já decodificados, larguras das fórmulas químicas e o esqueleto da tabela de retenção.
+    Decodificar os PNG era quase todo o custo de um relatório; agora acontece uma vez por processo.
+    Usa internos do fpdf 1.7.2 (_parsepng, images, pdf_version), fixado no requirements.txt: ao atualizar, comparar
+    byte a byte os PDFs gerados com os da versão anterior."""
+    def __init__(self):
+        leitor = FPDF()  # só para o parser de PNG e as métricas da fonte
+        self.logos = [(nome, leitor._parsepng(nome), x, y, w) for nome, x, y, w in LOGOS if os.path.exists(nome)]
+        self.quimica = {}
+        for tipo, partes in PARTES_QUIMICA.items():
+            dx, prontas = 0, []
+            for txt, size, offset_y in partes:
+                leitor.set_font('Arial', '', size); w = leitor.get_string_width(txt)
+                prontas.append((rotulo(txt), size, offset_y, dx, w)); dx += w
+            self.quimica[tipo] = prontas
+        # Cabeçalho da tabela de retenção, relativo ao canto (x, cy): (dx, dy, w, h, texto, borda, ln, alinhamento)
+        self.cabecalho_tabela = [
+            (None, None, 40, 10, rotulo("Ingredientes ativos"), 1, 0, 'C'), (None, None, 30, 10, rotulo("Resultado (kg/m3)"), 1, 0, 'C'), (None, None, 80, 5, rotulo("Balanceamento químico"), 1, 0, 'C'),
+            (150, 0, 40, 10, rotulo("Método"), 1, 0, 'C'), (70, 5, 30, 5, rotulo("Resultados (%)"), 1, 0, 'C'), (None, None, 50, 5, rotulo("Padrões"), 1, 0, 'C'),
+        ]
+
+@lru_cache(maxsize=1)
+def modelo(): return ModeloRelatorio()
+
+class RPDF(FPDF):
+    def header(self):
+        for nome, info, x, y, w in modelo().logos:
+            if nome not in self.images:
+                self.images[nome] = dict(info, i=len(self.images)+1)  # cópia: o fpdf apaga 'data' ao gravar
+                if 'smask' in info and self.pdf_version < '1.4': self.pdf_version = '1.4'  # o que o _parsepng faria
+            self.image(nome, x, y, w)
+        self.set_y(12); self.set_font('Arial','B',14); self.cell(0,10,rotulo('Relatório de Ensaio'),0,1,'C')
+    def footer(self): self.set_y(-15); self.set_font('Arial','I',6); self.cell(0,10,clean_text(f'Página {self.page_no()}'),0,0,'C')
+    def field(self, label, valor, x, y, w, h=6, align='L', multi=False, bold_value=False):
+        self.set_xy(x, y); self.set_font('Arial', 'B', 8); self.cell(w, 3, rotulo(label), 0, 0, 'L')
+        self.set_xy(x, y+3)
+        if bold_value: self.set_font('Arial', 'B', 8)
+        else: self.set_font('Arial', '', 8)
+        if multi: self.rect(x, y+3, w, h); self.multi_cell(w, 4, clean_text(valor), 0, align)
+        else: self.cell(w, h, clean_text(valor), 1, 0, align)
+    def draw_chem_label(self, tipo):
+        x_start, y_start = self.get_x(), self.get_y(); self.set_font('Arial', '', 8)
+        for txt, size, offset_y, dx, w in modelo().quimica.get(tipo, []):
+            self.set_font('Arial', '', size); self.set_xy(x_start + dx, y_start + offset_y); self.cell(w, 6, txt, 0, 0)
+        self.set_xy(x_start, y_start); self.cell(40, 6, "", 1, 0)
+    def esqueleto(self, partes, x, y):
+        for dx, dy, w, h, txt, borda, ln, align in partes:
+            if dx is not None: self.set_xy(x + dx, y + dy)
+            self.cell(w, h, txt, borda, ln, align)
+
+def gerar_pdf(d):
+    dn = normalizar(d); v = lambda keys: valor(dn, keys)
+    pdf = RPDF(); pdf.add_page(); pdf.set_auto_page_break(auto=True, margin=15)
+    y = 30
+    pdf.field("Data de Entrada", fmt_date(v(["Data de entrada", "Entrada"])), 10, y, 40, align='C')
+    pdf.field("Número ID", clean_text(v(["Código UFV", "ID"])), 150, y-5, 50, align='C')
+    pdf.field("Data de Emissão", fmt_date(v(["Data de Registro", "Fim da análise"])), 150, y+8, 50, align='C')
+    y += 20; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(0, 5, rotulo("DADOS DO CLIENTE"), 0, 1, 'L')
+    y += 6; pdf.field("Cliente", v(["Nome do Cliente"]), 10, y, 190)
+    y += 11; pdf.field("Cidade/UF", f"{v(['Cidade'])}/{v(['Estado'])}", 10, y, 90)
+    pdf.field("E-mail", v(["E-mail"]), 105, y, 95)
+    y += 15; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(0, 5, rotulo("IDENTIFICAÇÃO DA AMOSTRA"), 0, 1, 'L')
+    y += 6; pdf.field("Ref. Cliente", v(["Indentificação de Amostra"]), 10, y, 190)
+    y += 11; pdf.field("Madeira", v(["Madeira"]), 10, y, 90)
+    pdf.field("Produto", v(["Produto"]), 105, y, 95)
+    y += 11; pdf.field("Aplicação", v(["Aplicação"]), 10, y, 60)
+    pdf.field("Norma ABNT", v(["Norma"]), 75, y, 60)
+    ret_esp = v(["Retenção", "Retenção Esp."])
+    pdf.field("Retenção Esp.", fmt_num(ret_esp), 140, y, 60, align='C')
+    y += 20; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(190, 6, rotulo("RESULTADOS DE RETENÇÃO"), 1, 1, 'C')
+    pdf.set_font('Arial', 'B', 7); x=10; cy=pdf.get_y()
+    pdf.esqueleto(modelo().cabecalho_tabela, x, cy)
+    pdf.set_xy(x, cy+10); y_dados_inicio = cy+10
+    kg_cr=fmt_num(v(["Retenção Cromo (Kg/m³)","Retenção Cromo"])); kg_cu=fmt_num(v(["Retenção Cobre (Kg/m³)","Retenção Cobre"])); kg_as=fmt_num(v(["Retenção Arsênio (Kg/m³)","Retenção Arsênio"]))
+    pc_cr=fmt_num(v(["Balanço Cromo %","Balanço Cromo"])); pc_cu=fmt_num(v(["Balanço Cobre %","Balanço Cobre"])); pc_as=fmt_num(v(["Balanço Arsênio %","Balanço Arsênio"]))
+    pdf.set_font('Arial', '', 8)
+    def row_data_custom(tipo, k, p, mn, mx):
+        pdf.draw_chem_label(tipo); pdf.cell(30, 6, k, 1, 0, 'C'); pdf.cell(30, 6, p, 1, 0, 'C'); pdf.cell(25, 6, mn, 1, 0, 'C'); pdf.cell(25, 6, mx, 1, 0, 'C'); pdf.set_x(pdf.get_x() + 40); pdf.ln(6)
+    pdf.set_xy(160, y_dados_inicio); pdf.cell(40, 18, rotulo("Metodo UFV 01"), 1, 0, 'C'); pdf.set_xy(10, y_dados_inicio)
+    row_data_custom("Cr", kg_cr, pc_cr, "41,8", "53,2"); row_data_custom("Cu", kg_cu, pc_cu, "15,2", "22,8"); row_data_custom("As", kg_as, pc_as, "27,3", "40,7")
+    try: tot_kg = float(kg_cr.replace(",",".")) + float(kg_cu.replace(",",".")) + float(kg_as.replace(",","."))
+    except: tot_kg = 0
+    try: soma_pct = float(pc_cr.replace(",",".")) + float(pc_cu.replace(",",".")) + float(pc_as.replace(",","."))
+    except: soma_pct = 100.00
+    pdf.set_font('Arial', 'B', 8); pdf.cell(40, 6, rotulo("RETENÇÃO TOTAL"), 1, 0, 'L'); pdf.cell(30, 6, fmt_num(tot_kg), 1, 0, 'C'); pdf.cell(30, 6, fmt_num(soma_pct), 1, 0, 'C'); pdf.cell(90, 6, rotulo("Nota: Resultados restritos as amostras"), 1, 1, 'C')
+    y = pdf.get_y() + 5; pdf.set_y(y); pdf.set_font('Arial', 'B', 9); pdf.cell(190, 6, rotulo("RESULTADOS DE PENETRAÇÃO"), 0, 1, 'C'); y += 7
+    tipo_correto = v(["Descrição Grau", "Descrição do Grau", "Grau Descricao"])
+    pdf.field("Grau", v(["Grau"]), 10, y, 30, align='C'); pdf.field("Tipo", tipo_correto, 45, y, 50, align='C')
+    pdf.set_xy(100, y); pdf.set_font('Arial', 'B', 8); pdf.cell(90, 3, rotulo("Descrição"), 0, 0, 'L'); pdf.set_xy(100, y+3); pdf.set_font('Arial', '', 8); pdf.rect(100, y+3, 100, 12); pdf.multi_cell(100, 4, clean_text(v(["Descrição Penetração"])), 0, 'L')
+    y += 20; obs = v(["Observação", "Obs"])
+    if obs: pdf.set_y(y); pdf.field("Observações", obs, 10, y, 190, 12, 'L', multi=True, bold_value=True)
+    pdf.set_y(-35); pdf.set_font('Arial', '', 9); pdf.cell(0, 5, rotulo("Dr. Vinicius Resende de Castro - Supervisor do laboratório"), 0, 1, 'C')
+    return pdf.output(dest='S').encode('latin-1')
+
+# --- CACHE (POR CONTEÚDO) ---
+VERSAO_RELATORIO = 1  # mude ao alterar o layout do gerar_pdf, para não servir PDFs do layout antigo
+# Campos que o gerar_pdf lê (mesmas listas de chaves dos v([...]) de lá)
+CAMPOS_RELATORIO = [
+    ["Data de entrada", "Entrada"], ["Código UFV", "ID"], ["Data de Registro", "Fim da análise"], ["Nome do Cliente"], ["Cidade"], ["Estado"], ["E-mail"],
+    ["Indentificação de Amostra"], ["Madeira"], ["Produto"], ["Aplicação"], ["Norma"], ["Retenção", "Retenção Esp."],
+    ["Retenção Cromo (Kg/m³)", "Retenção Cromo"], ["Retenção Cobre (Kg/m³)", "Retenção Cobre"], ["Retenção Arsênio (Kg/m³)", "Retenção Arsênio"],
+    ["Balanço Cromo %", "Balanço Cromo"], ["Balanço Cobre %", "Balanço Cobre"], ["Balanço Arsênio %", "Balanço Arsênio"],
+    ["Descrição Grau", "Descrição do Grau", "Grau Descricao"], ["Grau"], ["Descrição Penetração"], ["Observação", "Obs"],
+]
+PDF_CACHE_BYTES = int(os.environ.get("PDF_CACHE_MB", 64)) * 2**20
+
+def chave_relatorio(d):
+    """Hash dos valores que vão para o relatório (com o tipo: data e texto são formatados diferente). Mesma chave, mesmo PDF."""
+    dn = normalizar(d)
+    partes = [str(VERSAO_RELATORIO)] + [f"{type(x).__name__}:{x}" for x in (valor(dn, keys) for keys in CAMPOS_RELATORIO)]
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+class CachePDF:
+    """LRU de PDFs prontos por chave_relatorio, limitado pelo total de bytes guardados."""
+    def __init__(self, limite):
+        self.limite, self.total, self.itens, self.lock = limite, 0, OrderedDict(), threading.Lock()
+    def pegar(self, chave):
+        with self.lock:
+            pdf = self.itens.get(chave)
+            if pdf is not None: self.itens.move_to_end(chave)
+            return pdf
+    def guardar(self, chave, pdf):
+        with self.lock:
+            if chave in self.itens: self.total -= len(self.itens.pop(chave))
+            if len(pdf) > self.limite: return
+            self.itens[chave] = pdf; self.total += len(pdf)
+            while self.total > self.limite: self.total -= len(self.itens.popitem(last=False)[1])
+
+cache_pdf = CachePDF(PDF_CACHE_BYTES)
+
+def pdf_relatorio(d):
+    """gerar_pdf passando pelo cache: o mesmo conteúdo não é gerado de novo a cada rerun. Retorna (chave, bytes)."""
+    chave = chave_relatorio(d)
+    pdf = cache_pdf.pegar(chave)
+    if pdf is None: pdf = gerar_pdf(d); cache_pdf.guardar(chave, pdf)
+    return chave, pdf
+
+# --- LOTE ---
+def nome_pdf(d):
+    return f"{d.get('Código UFV','Relatorio')}.pdf".replace("/", "-").replace("\\", "-")
+
+def _gerar_um(d):
+    try: return nome_pdf(d), gerar_pdf(d), None
+    except Exception as e: return nome_pdf(d), None, str(e)
+
+def gerar_pdfs_lote(linhas, ao_progredir=None, max_workers=None):
+    """Gera um PDF por linha (dicts) em um pool de processos; os que já estão no cache não são gerados de novo.
+    Retorna [(nome, bytes|None, erro|None)] na ordem de entrada."""
+    if not linhas: return []
+    chaves = [chave_relatorio(d) for d in linhas]
+    resultados = [None] * len(linhas); faltando = []
+    for i, (d, chave) in enumerate(zip(linhas, chaves)):
+        pdf = cache_pdf.pegar(chave)
+        if pdf is not None: resultados[i] = (nome_pdf(d), pdf, None)
+        else: faltando.append(i)
+    feitos = len(linhas) - len(faltando)
+    if ao_progredir and feitos: ao_progredir(feitos, len(linhas))
+    def concluir(i, resultado):
+        resultados[i] = resultado
+        if resultado[1] is not None: cache_pdf.guardar(chaves[i], resultado[1])
+    workers = min(max_workers or os.cpu_count() or 1, len(faltando))
+    if workers <= 1:
+        for i in faltando:
+            concluir(i, _gerar_um(linhas[i])); feitos += 1
+            if ao_progredir: ao_progredir(feitos, len(linhas))
+        return resultados
+    # spawn, e não fork: o servidor do streamlit tem várias threads (tornado, fila de salvamento, conexões do Drive) e um
+    # filho criado por fork pode travar num lock que estava preso na hora. O worker só precisa deste módulo (o spawn também
+    # importa o script principal, mas sem rodar o main(): app.py e processar_amostras.py ficam atrás do `if __name__`).
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = {pool.submit(_gerar_um, linhas[i]): i for i in faltando}
+        for fut in as_completed(futuros):
+            concluir(futuros[fut], fut.result()); feitos += 1
+            if ao_progredir: ao_progredir(feitos, len(linhas))
+    return resultados
+
+def montar_zip(arquivos):
+    """ZIP em memória a partir de [(nome, bytes)]; nomes repetidos ganham sufixo."""
+    buf = io.BytesIO(); usados = {}
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nome, dados in arquivos:
+            n = usados.get(nome, 0); usados[nome] = n + 1
+            if n: base, ext = os.path.splitext(nome); nome = f"{base}_{n+1}{ext}"
+            zf.writestr(nome, dados)
+    return buf.getvalue()